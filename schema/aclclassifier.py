@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+'''
+Reference software classifier for ACL_Entry lists, with incremental,
+per-ACE updates, and a benchmark against linear ACE matching.
+
+Usage:
+    aclclassifier.py [--acl FILE] [--entries N] [--packets N] [--seed S]
+
+An ACL is {sequence_number: ace}, where ace holds ACL_Entry columns
+(action, src_ip, dst_ip, protocol, src/dst_l4_port_min/max and
+src/dst_l4_port_range_reverse), plus the "generation" of the ACE. The
+first ACE in sequence number order that matches a packet decides;
+ACEs without an action are not programmed, and a packet that matches
+no ACE is denied.
+
+The classifier splits the value space of every field (source and
+destination address, protocol, source and destination L4 port) into
+elementary intervals, and keeps for each interval the set of ACEs that
+match it, as a bitmap. A lookup intersects the bitmaps of the intervals
+of the packet and picks the matching ACE with the lowest sequence
+number. Addresses with a non-contiguous mask match every interval and
+are checked against the packet afterwards.
+
+update() applies a new version of the ACL by comparing generations, and
+only adds or removes the bits of the ACEs that were added, changed or
+deleted, the way switchd applies cfg_aces incrementally.
+
+--acl loads an ACL from a JSON file in the above format; otherwise a
+synthetic ACL of --entries ACEs is generated. The benchmark times full
+compilation, a one-ACE update, classifier lookups and linear matching,
+and checks that both give the same result for every packet.
+'''
+
+import sys
+import json
+import time
+import random
+import argparse
+from bisect import bisect_right
+
+PERMIT = 'permit'
+DENY = 'deny'
+
+TCP = 6
+UDP = 17
+L4_PROTOCOLS = (TCP, UDP)
+
+ADDRESS_MAX = 2 ** 32 - 1
+PROTOCOL_MAX = 255
+PORT_MAX = 65535
+# Value of the L4 ports of packets that are neither TCP nor UDP.
+NO_PORT = -1
+
+FIELDS = ('src_ip', 'dst_ip', 'protocol', 'src_l4_port', 'dst_l4_port')
+
+
+def parse_ip(text):
+    '''
+    Parses an ACE address, "X.X.X.X", "X.X.X.X/N" or "X.X.X.X/X.X.X.X",
+    into (address, mask) integers.
+    '''
+    address, _, mask = text.partition('/')
+    value = 0
+    for octet in address.split('.'):
+        value = (value << 8) | int(octet)
+    if not mask:
+        bits = ADDRESS_MAX
+    elif '.' in mask:
+        bits = 0
+        for octet in mask.split('.'):
+            bits = (bits << 8) | int(octet)
+    else:
+        bits = (ADDRESS_MAX << (32 - int(mask))) & ADDRESS_MAX
+    return value & bits, bits
+
+
+def _mask_range(address, mask):
+    '''
+    Returns the (low, high) interval covered by a contiguous mask, or
+    None for a non-contiguous mask.
+    '''
+    host = ~mask & ADDRESS_MAX
+    if host & (host + 1):
+        return None
+    return address, address | host
+
+
+def _port_ranges(ace, prefix):
+    '''
+    Returns the list of (low, high) intervals of L4 port values matched by
+    the port columns of ace with the given prefix ('src' or 'dst').
+    '''
+    lo = ace.get(prefix + '_l4_port_min')
+    hi = ace.get(prefix + '_l4_port_max')
+    if lo is None and hi is None:
+        return [(NO_PORT, PORT_MAX)]
+    lo = 0 if lo is None else lo
+    hi = PORT_MAX if hi is None else hi
+    if not ace.get(prefix + '_l4_port_range_reverse'):
+        return [(lo, hi)]
+    ranges = []
+    if lo > 0:
+        ranges.append((0, lo - 1))
+    if hi < PORT_MAX:
+        ranges.append((hi + 1, PORT_MAX))
+    return ranges
+
+
+class Rule(object):
+    '''
+    An ACE compiled into the intervals it matches on every field.
+    '''
+
+    __slots__ = ('seq', 'generation', 'action', 'ranges', 'masks', 'slot')
+
+    def __init__(self, seq, ace):
+        self.seq = seq
+        self.generation = ace.get('generation')
+        self.action = ace.get('action')
+        self.ranges = {}
+        self.masks = {}
+        self.slot = None
+        for field in ('src_ip', 'dst_ip'):
+            if ace.get(field) is None:
+                self.ranges[field] = [(0, ADDRESS_MAX)]
+                continue
+            address, mask = parse_ip(ace[field])
+            interval = _mask_range(address, mask)
+            if interval is None:
+                self.ranges[field] = [(0, ADDRESS_MAX)]
+                self.masks[FIELDS.index(field)] = (address, mask)
+            else:
+                self.ranges[field] = [interval]
+        protocol = ace.get('protocol')
+        self.ranges['protocol'] = [(0, PROTOCOL_MAX)] if protocol is None \
+            else [(protocol, protocol)]
+        for prefix in ('src', 'dst'):
+            self.ranges[prefix + '_l4_port'] = _port_ranges(ace, prefix)
+
+    def check_masks(self, packet):
+        for i, (address, mask) in self.masks.items():
+            if packet[i] & mask != address:
+                return False
+        return True
+
+    def matches(self, packet):
+        for field, value in zip(FIELDS, packet):
+            for lo, hi in self.ranges[field]:
+                if lo <= value <= hi:
+                    break
+            else:
+                return False
+        return self.check_masks(packet)
+
+
+def linear_match(rules, packet):
+    '''
+    Returns (sequence_number, action) of the first of rules, a list of
+    Rule in sequence number order, that matches packet, or None.
+    '''
+    for rule in rules:
+        if rule.action is not None and rule.matches(packet):
+            return rule.seq, rule.action
+    return None
+
+
+class Field(object):
+    '''
+    Elementary intervals of one field: starts[i] is the first value of
+    interval i, and bits[i] the bitmap of the rules that match it.
+    '''
+
+    __slots__ = ('high', 'starts', 'bits')
+
+    def __init__(self, low, high):
+        self.high = high
+        self.starts = [low]
+        self.bits = [0]
+
+    def _split(self, value):
+        # Returns the index of the interval that starts at value,
+        # splitting the interval that contains it if needed.
+        i = bisect_right(self.starts, value) - 1
+        if self.starts[i] == value:
+            return i
+        self.starts.insert(i + 1, value)
+        self.bits.insert(i + 1, self.bits[i])
+        return i + 1
+
+    def add(self, ranges, bit):
+        for lo, hi in ranges:
+            first = self._split(lo)
+            last = self._split(hi + 1) if hi < self.high \
+                else len(self.starts)
+            for i in range(first, last):
+                self.bits[i] |= bit
+
+    def remove(self, ranges, bit):
+        for lo, hi in ranges:
+            first = bisect_right(self.starts, lo) - 1
+            last = bisect_right(self.starts, hi)
+            for i in range(first, last):
+                self.bits[i] &= ~bit
+
+    def lookup(self, value):
+        return self.bits[bisect_right(self.starts, value) - 1]
+
+
+class Classifier(object):
+    '''
+    Compiled ACL. Every programmed rule owns one bit of the field
+    bitmaps. Bits are handed out in sequence number order; as long as
+    updates keep that order (changed ACEs reuse their bit, added ACEs
+    come last), the lowest matching bit is the first matching ACE.
+    '''
+
+    def __init__(self, acl=None):
+        self.fields = {
+            'src_ip': Field(0, ADDRESS_MAX),
+            'dst_ip': Field(0, ADDRESS_MAX),
+            'protocol': Field(0, PROTOCOL_MAX),
+            'src_l4_port': Field(NO_PORT, PORT_MAX),
+            'dst_l4_port': Field(NO_PORT, PORT_MAX),
+        }
+        self.rules = {}
+        self.slots = []
+        self.free = []
+        self.ordered = True
+        self.last = None
+        if acl:
+            self.update(acl)
+
+    def _add(self, seq, ace, slot=None):
+        rule = Rule(seq, ace)
+        self.rules[seq] = rule
+        if rule.action is None:
+            return
+        if slot is None:
+            # A reused bit, or an appended bit below the last one, breaks
+            # the order.
+            if self.free:
+                slot = self.free.pop()
+                self.ordered = False
+            else:
+                slot = len(self.slots)
+                self.slots.append(None)
+                if self.last is not None and seq < self.last:
+                    self.ordered = False
+                self.last = seq
+        rule.slot = slot
+        self.slots[slot] = rule
+        for field in FIELDS:
+            self.fields[field].add(rule.ranges[field], 1 << slot)
+
+    def _remove(self, seq):
+        # Returns the bit of the removed rule, which the caller reuses
+        # or frees.
+        rule = self.rules.pop(seq)
+        if rule.action is None:
+            return None
+        self.slots[rule.slot] = None
+        for field in FIELDS:
+            self.fields[field].remove(rule.ranges[field], 1 << rule.slot)
+        return rule.slot
+
+    def update(self, acl):
+        '''
+        Applies acl, a new version of the ACL. ACEs are compared by
+        generation: only the ACEs that were added, deleted, or whose
+        generation changed are reprogrammed. Returns (added, changed,
+        removed) counts.
+        '''
+        added = changed = removed = 0
+        for seq in [s for s in self.rules if s not in acl]:
+            slot = self._remove(seq)
+            if slot is not None:
+                self.free.append(slot)
+            removed += 1
+        for seq in sorted(acl):
+            ace = acl[seq]
+            rule = self.rules.get(seq)
+            slot = None
+            if rule is None:
+                added += 1
+            elif ace.get('generation') is None or \
+                    rule.generation != ace.get('generation'):
+                slot = self._remove(seq)
+                if slot is not None and ace.get('action') is None:
+                    self.free.append(slot)
+                    slot = None
+                changed += 1
+            else:
+                continue
+            self._add(seq, ace, slot)
+        return added, changed, removed
+
+    def compile(self, acl):
+        '''
+        Recompiles acl from scratch, which restores the sequence number
+        order of the bits and drops the intervals of deleted ACEs.
+        '''
+        self.__init__(acl)
+
+    def match(self, packet):
+        '''
+        Returns (sequence_number, action) of the first ACE that matches
+        packet, a tuple of FIELDS values, or None.
+        '''
+        bits = -1
+        for field, value in zip(FIELDS, packet):
+            bits &= self.fields[field].lookup(value)
+            if not bits:
+                return None
+        best = None
+        slots = self.slots
+        while bits:
+            low = bits & -bits
+            rule = slots[low.bit_length() - 1]
+            if (best is None or rule.seq < best.seq) and \
+                    rule.check_masks(packet):
+                best = rule
+                if self.ordered:
+                    break
+            bits ^= low
+        return (best.seq, best.action) if best is not None else None
+
+    def intervals(self):
+        return sum(len(field.starts) for field in self.fields.values())
+
+
+def _address(rng, length):
+    value = rng.getrandbits(32) & ((ADDRESS_MAX << (32 - length))
+                                   & ADDRESS_MAX)
+    return '%d.%d.%d.%d/%d' % (value >> 24, (value >> 16) & 255,
+                               (value >> 8) & 255, value & 255, length)
+
+
+def synthetic_acl(entries, rng):
+    '''
+    Returns an ACL of entries ACEs with a mix of prefixes, protocols and
+    L4 port ranges, ending with a "permit any".
+    '''
+    acl = {}
+    for i in range(entries - 1):
+        ace = {'action': rng.choice((PERMIT, DENY)), 'generation': 1}
+        ace['src_ip'] = _address(rng, rng.choice((8, 16, 24, 32)))
+        if rng.random() < 0.8:
+            ace['dst_ip'] = _address(rng, rng.choice((16, 24, 32)))
+        if rng.random() < 0.7:
+            ace['protocol'] = rng.choice((TCP, UDP, TCP, UDP, 1))
+            if ace['protocol'] in L4_PROTOCOLS and rng.random() < 0.6:
+                port = rng.randint(0, PORT_MAX - 1024)
+                ace['dst_l4_port_min'] = port
+                ace['dst_l4_port_max'] = port + rng.choice((0, 0, 10, 1023))
+                ace['dst_l4_port_range_reverse'] = rng.random() < 0.1
+        acl[(i + 1) * 10] = ace
+    acl[entries * 10] = {'action': PERMIT, 'generation': 1}
+    return acl
+
+
+def synthetic_packets(acl, count, rng):
+    '''
+    Returns count packets, half of them built to hit a random ACE.
+    '''
+    aces = [ace for ace in acl.values() if ace.get('src_ip')]
+    packets = []
+    for _ in range(count):
+        src, dst = rng.getrandbits(32), rng.getrandbits(32)
+        if aces and rng.random() < 0.5:
+            ace = rng.choice(aces)
+            address, mask = parse_ip(ace['src_ip'])
+            src = address | (src & ~mask & ADDRESS_MAX)
+            if ace.get('dst_ip'):
+                address, mask = parse_ip(ace['dst_ip'])
+                dst = address | (dst & ~mask & ADDRESS_MAX)
+        protocol = rng.choice((TCP, UDP, 1))
+        if protocol in L4_PROTOCOLS:
+            ports = rng.randint(0, PORT_MAX), rng.randint(0, PORT_MAX)
+        else:
+            ports = NO_PORT, NO_PORT
+        packets.append((src, dst, protocol) + ports)
+    return packets
+
+
+def _timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def benchmark(acl, packets, rng):
+    '''
+    Returns a dict of timings, in seconds, and the number of packets on
+    which the classifier and linear matching disagree.
+    '''
+    compile_time, classifier = _timed(Classifier, acl)
+
+    edited = dict(acl)
+    seq = rng.choice(sorted(acl))
+    ace = dict(acl[seq])
+    ace['generation'] = (ace.get('generation') or 0) + 1
+    ace['action'] = DENY if ace.get('action') == PERMIT else PERMIT
+    edited[seq] = ace
+    update_time, counts = _timed(classifier.update, edited)
+
+    classify_time, classified = _timed(
+        lambda: [classifier.match(p) for p in packets])
+    linear_packets = packets[:max(1, min(len(packets),
+                                         2000000 // max(len(acl), 1)))]
+    rules = [Rule(seq, edited[seq]) for seq in sorted(edited)]
+    linear_time, linear = _timed(
+        lambda: [linear_match(rules, p) for p in linear_packets])
+
+    mismatches = sum(1 for a, b in zip(classified, linear) if a != b)
+    return {
+        'entries': len(acl),
+        'intervals': classifier.intervals(),
+        'compile': compile_time,
+        'update': update_time,
+        'updated': counts,
+        'classify': classify_time / len(packets),
+        'linear': linear_time / len(linear_packets),
+        'mismatches': mismatches,
+    }
+
+
+def load_acl(path):
+    with open(path) as fp:
+        return dict((int(seq), ace) for seq, ace in json.load(fp).items())
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the reference ACL classifier.')
+    parser.add_argument('--acl', metavar='FILE',
+                        help='JSON object of sequence number to ACE')
+    parser.add_argument('--entries', type=int, default=512,
+                        help='ACEs of the synthetic ACL (default: 512, the '
+                        'ACL:cfg_aces maximum)')
+    parser.add_argument('--packets', type=int, default=20000,
+                        help='packets to classify (default: 20000)')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+#
+# main
+#
+def main(argv):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    acl = load_acl(args.acl) if args.acl else \
+        synthetic_acl(args.entries, rng)
+    packets = synthetic_packets(acl, args.packets, rng)
+
+    result = benchmark(acl, packets, rng)
+    print('%d ACEs, %d intervals' % (result['entries'], result['intervals']))
+    print('compile %.3f s, one-ACE update %.3f ms (%d added, %d changed, '
+          '%d removed)' % ((result['compile'], result['update'] * 1e3) +
+                           result['updated']))
+    print('classifier %.1f us/packet, linear %.1f us/packet, speedup %.0fx'
+          % (result['classify'] * 1e6, result['linear'] * 1e6,
+             result['linear'] / max(result['classify'], 1e-9)))
+    if result['mismatches']:
+        print('%d packets classified differently' % result['mismatches'])
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+'''
+Estimates the memory that a given mix of rows takes in ovsdb-server and
+in a client holding a full IDL replica, from the column types of an
+extended schema.
+
+Usage:
+    capacity.py [options] schema [--rows TABLE=N ...]
+
+For example, to size a leaf switch:
+
+    capacity.py schema/vswitch.extschema --xml schema/vswitch.xml \\
+        --rows Route=1000000 --rows BGP_Route=2000000 --rows MAC=262144 \\
+        --rows Neighbor=65536 --rows OSPF_LSA=100000
+
+The model follows the 64-bit layout of the OVSDB data structures: every
+row carries a fixed header plus one datum per column, every datum an
+array of 16 byte atoms, strings are separate allocations, every index
+adds a hash node per row and every reference an arc in the IDL. The
+number of elements in a set or map is taken, in order, from:
+
+  - the number of rows of the referenced table per row of this table,
+    for "1:m" references when both row counts are known;
+  - the number of keys documented for the column in the schema XML;
+  - --collection-size;
+
+and capped by the bounded 'max' of the column, which is a limit rather
+than a typical size (Port:trunks allows 4096 VLANs).
+
+The result is reported per table and per category (configuration,
+status, statistics). It is an estimate: use it to compare table mixes
+and to find the tables that dominate, not as an exact figure.
+'''
+
+import sys
+import json
+import argparse
+from collections import OrderedDict
+
+import extschema
+
+# Approximate sizes, in bytes, for a 64-bit build.
+ATOM_SIZE = 16          # union ovsdb_atom
+DATUM_SIZE = 24         # struct ovsdb_datum
+SERVER_ROW_SIZE = 64    # struct ovsdb_row, without its datums
+SERVER_HIDDEN_COLUMNS = 2   # _uuid and _version
+SERVER_INDEX_NODE = 16  # struct hmap_node per row per index
+SERVER_WEAK_REF = 64    # struct ovsdb_weak_ref per weak reference
+IDL_ROW_SIZE = 144      # struct ovsdb_idl_row embedded in each ovsrec
+IDL_ARC_SIZE = 48       # struct ovsdb_idl_arc per reference
+POINTER_SIZE = 8
+HMAP_BUCKET = 8         # table hash bucket per row
+
+CATEGORIES = ('configuration', 'status', 'statistics', 'per-value', None)
+
+
+def malloc_size(n):
+    '''
+    Bytes taken by an n byte allocation with glibc malloc.
+    '''
+    if n <= 0:
+        return 0
+    return max(32, (n + 8 + 15) & ~15)
+
+
+class Model(object):
+    def __init__(self, schema, rows, keys=None, default_rows=1,
+                 collection_size=4, string_length=16, optional_fill=1.0):
+        self.schema = schema
+        self.rows = rows
+        self.keys = keys or {}
+        self.default_rows = default_rows
+        self.collection_size = collection_size
+        self.string_length = string_length
+        self.optional_fill = optional_fill
+
+    def table_rows(self, table):
+        if table in self.rows:
+            return self.rows[table]
+        max_rows = self.schema['tables'][table].get('maxRows')
+        if max_rows is not None:
+            return min(max_rows, self.default_rows)
+        return self.default_rows
+
+    def elements(self, table, column, coldef, coltype):
+        '''
+        Expected number of elements in a datum of the column.
+        '''
+        if coltype.is_scalar():
+            return 1.0
+        if coltype.is_optional():
+            return self.optional_fill
+
+        ref = coltype.ref_table()
+        if ref and coldef.get('relationship') == '1:m' and \
+                ref in self.rows and table in self.rows and self.rows[table]:
+            n = float(self.rows[ref]) / self.rows[table]
+        elif self.keys.get(table, {}).get(column):
+            n = float(len(self.keys[table][column]))
+        else:
+            n = float(self.collection_size)
+        if coltype.max != extschema.UNLIMITED:
+            n = min(n, coltype.max)
+        return max(n, coltype.min)
+
+    def string_size(self, base, names=None):
+        '''
+        Expected heap bytes for one string atom of base.
+        '''
+        enum = base.get('enum')
+        if enum is not None:
+            values = enum[1] if isinstance(enum, list) else [enum]
+            length = sum(len(v) for v in values) / float(len(values))
+        elif names:
+            length = sum(len(k) for k in names) / float(len(names))
+        elif base.get('minLength') == base.get('maxLength') and \
+                'maxLength' in base:
+            length = base['maxLength']
+        else:
+            length = min(base.get('maxLength', self.string_length),
+                         self.string_length)
+        return malloc_size(int(length) + 1)
+
+    def column_bytes(self, table, column, coldef):
+        '''
+        Returns (server bytes, IDL bytes) that the column takes per row.
+        '''
+        coltype = extschema.column_type(coldef)
+        n = self.elements(table, column, coldef, coltype)
+
+        bases = [coltype.key] + ([coltype.value] if coltype.is_map() else [])
+        names = list(self.keys.get(table, {}).get(column, {}))
+
+        # Atom arrays (keys and values) plus heap strings, shared by the
+        # server datum and the IDL datum.
+        datum = DATUM_SIZE
+        strings = 0
+        refs = 0
+        weak_refs = 0
+        for i, base in enumerate(bases):
+            datum += malloc_size(int(round(n * ATOM_SIZE))) if n else 0
+            if base['type'] == 'string':
+                strings += n * self.string_size(base,
+                                                names if i == 0 else None)
+            elif base['type'] == 'uuid' and base.get('refTable'):
+                refs += n
+                if base.get('refType') == 'weak':
+                    weak_refs += n
+
+        server = datum + strings + weak_refs * SERVER_WEAK_REF
+
+        # The generated ovsrec struct has a field per column (pointers and
+        # counts); sets and maps get arrays of their own, references an
+        # arc per element.
+        if coltype.is_scalar():
+            field = POINTER_SIZE
+            arrays = 0
+        elif coltype.is_optional():
+            field = 2 * POINTER_SIZE
+            arrays = 0
+        else:
+            field = (len(bases) + 1) * POINTER_SIZE
+            arrays = sum(malloc_size(int(round(n * POINTER_SIZE)))
+                         for _ in bases) if n else 0
+        idl = datum + strings + field + arrays + refs * IDL_ARC_SIZE
+
+        return server, idl
+
+    def table_report(self, table):
+        '''
+        Returns an OrderedDict with the per-row and total estimates of
+        table, split by category.
+        '''
+        tabledef = self.schema['tables'][table]
+        columns = tabledef['columns']
+        rows = self.table_rows(table)
+
+        server_row = malloc_size(SERVER_ROW_SIZE + DATUM_SIZE *
+                                 (len(columns) + SERVER_HIDDEN_COLUMNS)) + \
+            SERVER_INDEX_NODE * len(tabledef.get('indexes', [])) + \
+            HMAP_BUCKET
+        idl_row = IDL_ROW_SIZE + HMAP_BUCKET + \
+            malloc_size(DATUM_SIZE * len(columns))
+        server_cat = OrderedDict((c, 0.0) for c in CATEGORIES)
+        idl_cat = OrderedDict((c, 0.0) for c in CATEGORIES)
+
+        for column, coldef in columns.items():
+            server, idl = self.column_bytes(table, column, coldef)
+            category = extschema.resolve_category(tabledef, column)
+            server_cat[category] += server
+            idl_cat[category] += idl
+
+        server_per_row = server_row + sum(server_cat.values())
+        idl_per_row = idl_row + sum(idl_cat.values())
+        return OrderedDict([
+            ('table', table),
+            ('rows', rows),
+            ('server_row_bytes', int(server_per_row)),
+            ('idl_row_bytes', int(idl_per_row)),
+            ('server_bytes', int(server_per_row * rows)),
+            ('idl_bytes', int(idl_per_row * rows)),
+            ('server_categories', OrderedDict(
+                (c or 'none', int(b * rows)) for c, b in server_cat.items())),
+            ('idl_categories', OrderedDict(
+                (c or 'none', int(b * rows)) for c, b in idl_cat.items())),
+            ('server_overhead', int(server_row * rows)),
+            ('idl_overhead', int(idl_row * rows)),
+        ])
+
+    def report(self):
+        tables = [self.table_report(t) for t in self.schema['tables']]
+        tables.sort(key=lambda t: -t['server_bytes'])
+
+        categories = OrderedDict()
+        for name in [c or 'none' for c in CATEGORIES] + ['row overhead']:
+            categories[name] = OrderedDict([('server_bytes', 0),
+                                            ('idl_bytes', 0)])
+        for t in tables:
+            for name, b in t['server_categories'].items():
+                categories[name]['server_bytes'] += b
+            for name, b in t['idl_categories'].items():
+                categories[name]['idl_bytes'] += b
+            categories['row overhead']['server_bytes'] += t['server_overhead']
+            categories['row overhead']['idl_bytes'] += t['idl_overhead']
+
+        return OrderedDict([
+            ('tables', tables),
+            ('categories', categories),
+            ('server_bytes', sum(t['server_bytes'] for t in tables)),
+            ('idl_bytes', sum(t['idl_bytes'] for t in tables)),
+        ])
+
+
+def _mib(n):
+    return '%10.1f' % (n / 1048576.0)
+
+
+def print_report(report, show_all):
+    print('%-28s %10s %8s %8s %10s %10s' % (
+        'Table', 'Rows', 'B/row', 'B/row', 'server', 'IDL'))
+    print('%-28s %10s %8s %8s %10s %10s' % (
+        '', '', 'server', 'IDL', 'MiB', 'MiB'))
+    for t in report['tables']:
+        if not show_all and t['rows'] <= 1:
+            continue
+        print('%-28s %10d %8d %8d %s %s' % (
+            t['table'], t['rows'], t['server_row_bytes'], t['idl_row_bytes'],
+            _mib(t['server_bytes']), _mib(t['idl_bytes'])))
+    print('')
+    print('%-28s %10s %10s' % ('Category', 'server MiB', 'IDL MiB'))
+    for name, c in report['categories'].items():
+        if c['server_bytes'] or c['idl_bytes']:
+            print('%-28s %s %s' % (name, _mib(c['server_bytes']),
+                                   _mib(c['idl_bytes'])))
+    print('%-28s %s %s' % ('Total', _mib(report['server_bytes']),
+                           _mib(report['idl_bytes'])))
+
+
+def parse_rows(specs, rows_file, schema):
+    rows = OrderedDict()
+    if rows_file:
+        with open(rows_file) as fp:
+            rows.update(json.load(fp, object_pairs_hook=OrderedDict))
+    for spec in specs or []:
+        table, _, count = spec.partition('=')
+        rows[table] = int(count)
+    for table in rows:
+        if table not in schema['tables']:
+            raise ValueError('unknown table %s' % table)
+    return rows
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Estimate OVSDB memory for a mix of table sizes.')
+    parser.add_argument('schema')
+    parser.add_argument('--xml', help='schema XML, for documented map keys')
+    parser.add_argument('--rows', action='append', metavar='TABLE=N',
+                        help='number of rows of TABLE (repeatable)')
+    parser.add_argument('--rows-file', metavar='FILE',
+                        help='JSON object of table name to row count')
+    parser.add_argument('--default-rows', type=int, default=1,
+                        help='rows of the tables not given (default: 1)')
+    parser.add_argument('--collection-size', type=int, default=4,
+                        help='elements of sets and maps with no better '
+                             'estimate, capped by their max (default: 4)')
+    parser.add_argument('--string-length', type=int, default=16,
+                        help='typical length of free-form strings '
+                             '(default: 16)')
+    parser.add_argument('--optional-fill', type=float, default=1.0,
+                        help='fraction of optional columns that are set '
+                             '(default: 1.0)')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    parser.add_argument('--all', action='store_true',
+                        help='also list tables with a single row')
+    return parser.parse_args(argv)
+
+
+#
+# main
+#
+def main(argv):
+    args = parse_args(argv)
+    schema = extschema.load(args.schema)
+    try:
+        rows = parse_rows(args.rows, args.rows_file, schema)
+    except ValueError as e:
+        print('capacity.py: %s' % e)
+        return 1
+    keys = extschema.load_keys(args.xml) if args.xml else None
+
+    model = Model(schema, rows, keys, args.default_rows,
+                  args.collection_size, args.string_length,
+                  args.optional_fill)
+    report = model.report()
+    if args.json:
+        print(json.dumps(report, indent=2, separators=(',', ': ')))
+    else:
+        print_report(report, args.all)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
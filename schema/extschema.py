@@ -0,0 +1,190 @@
+'''
+Helpers shared by the schema build tools to read an extended schema
+(*.extschema) and normalize its column types the way ovsdb-server does,
+and to read the map keys documented in the schema XML.
+'''
+
+import json
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict
+
+UNLIMITED = 'unlimited'
+
+
+def load(path):
+    '''
+    Loads the extended schema at path, preserving key order.
+    '''
+    with open(path) as fp:
+        return json.loads(fp.read(), object_pairs_hook=OrderedDict)
+
+
+def base_type(base):
+    '''
+    Normalizes an OVSDB <base-type> (either an atomic type name or an
+    object) into a dict that always has a 'type' key.
+    '''
+    if base is None:
+        return None
+    if isinstance(base, dict):
+        return base
+    return OrderedDict([('type', base)])
+
+
+class ColumnType(object):
+    '''
+    Normalized OVSDB column <type>: key and value base types, min and max.
+    max is an integer or UNLIMITED.
+    '''
+
+    def __init__(self, coltype):
+        if not isinstance(coltype, dict):
+            coltype = {'key': coltype}
+        self.key = base_type(coltype['key'])
+        self.value = base_type(coltype.get('value'))
+        self.min = coltype.get('min', 1)
+        self.max = coltype.get('max', 1)
+
+    def is_map(self):
+        return self.value is not None
+
+    def is_set(self):
+        return self.value is None and self.max != 1
+
+    def is_optional(self):
+        return self.min == 0 and self.max == 1
+
+    def is_scalar(self):
+        return self.value is None and self.min == 1 and self.max == 1
+
+    def ref_table(self):
+        return self.key.get('refTable') or \
+            (self.value.get('refTable') if self.value else None)
+
+    def kind(self):
+        if self.is_map():
+            return 'map'
+        if self.is_set():
+            return 'set'
+        if self.is_optional():
+            return 'optional'
+        return 'scalar'
+
+
+def column_type(coldef):
+    return ColumnType(coldef['type'])
+
+
+def column_category(coldef):
+    '''
+    Returns (category, argument) for a column. category is one of
+    'configuration', 'status', 'statistics', 'follows', 'per-value' or
+    None. argument is the followed column for 'follows' and the list of
+    {"value", "category"} objects for 'per-value'.
+    '''
+    category = coldef.get('category')
+    if isinstance(category, dict):
+        if 'follows' in category:
+            return 'follows', category['follows']
+        if 'per-value' in category:
+            return 'per-value', category['per-value']
+        return None, None
+    return category, None
+
+
+def resolve_category(table, column_name):
+    '''
+    Returns the category a column of table (a table definition) ends up
+    with once 'follows' is resolved: 'configuration', 'status',
+    'statistics', 'per-value' (decided by the value of a column, row by
+    row) or None.
+    '''
+    seen = set()
+    while column_name not in seen:
+        seen.add(column_name)
+        category, arg = column_category(table['columns'][column_name])
+        if category != 'follows':
+            return category
+        column_name = arg
+    return None
+
+
+def idl_indexes(table):
+    '''
+    Returns [(name, [column, ...]), ...] for the "idl_indexes" of table (a
+    table definition): the non-unique indexes that IDL clients build on
+    their replica, named "by_" followed by the columns.
+    '''
+    return [('by_' + '_'.join(columns), list(columns))
+            for columns in table.get('idl_indexes', [])]
+
+
+TABLE_MEMBERS = ('columns', 'maxRows', 'isRoot', 'indexes')
+COLUMN_MEMBERS = ('type', 'ephemeral', 'mutable')
+TYPE_MEMBERS = ('key', 'value', 'min', 'max')
+BASE_TYPE_MEMBERS = ('type', 'enum', 'minInteger', 'maxInteger', 'minReal',
+                     'maxReal', 'minLength', 'maxLength', 'refTable',
+                     'refType')
+
+
+def check_structure(schema):
+    '''
+    Returns the list of members of the tables, columns, column types and
+    base types of schema (stripped of its annotations) that OVSDB does
+    not define, and that ovsdb-server would reject.
+    '''
+    errors = []
+
+    def unknown(obj, allowed, name):
+        for member in obj:
+            if member not in allowed:
+                errors.append('%s: unknown member "%s"' % (name, member))
+
+    for table_name, table in schema['tables'].items():
+        unknown(table, TABLE_MEMBERS, table_name)
+        for column_name, coldef in table['columns'].items():
+            name = '%s.%s' % (table_name, column_name)
+            unknown(coldef, COLUMN_MEMBERS, name)
+            coltype = coldef.get('type')
+            if not isinstance(coltype, dict):
+                continue
+            unknown(coltype, TYPE_MEMBERS, name + ' type')
+            for part in ('key', 'value'):
+                if isinstance(coltype.get(part), dict):
+                    unknown(coltype[part], BASE_TYPE_MEMBERS,
+                            '%s type %s' % (name, part))
+    return errors
+
+
+def iter_columns(schema):
+    '''
+    Yields (table_name, column_name, column_definition) for every column
+    in schema, in schema order.
+    '''
+    for table_name, table in schema['tables'].items():
+        for column_name, coldef in table['columns'].items():
+            yield table_name, column_name, coldef
+
+
+def load_keys(xml_path):
+    '''
+    Reads the map keys documented in the schema XML, i.e. the
+    <column name="..." key="..." type='...'> elements. Returns
+    {table: {column: {key: {'type': base type or None, 'doc': text}}}},
+    in document order.
+    '''
+    keys = OrderedDict()
+    root = ElementTree.parse(xml_path).getroot()
+    for table in root.iter('table'):
+        for column in table.iter('column'):
+            key = column.get('key')
+            if key is None:
+                continue
+            keytype = column.get('type')
+            doc = ' '.join(''.join(column.itertext()).split())
+            keys.setdefault(table.get('name'), OrderedDict()).setdefault(
+                column.get('name'), OrderedDict())[key] = {
+                    'type': json.loads(keytype) if keytype else None,
+                    'doc': doc,
+                }
+    return keys
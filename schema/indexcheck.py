@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+'''
+Checks that the tables that grow large at scale have an index for their
+typical lookups, and optionally measures what such an index buys.
+
+Usage:
+    indexcheck.py [--benchmark] [--scale F] [--rows TABLE=N ...] schema
+
+LOOKUPS lists the lookups that daemons and the CLI do on each large
+table (for example OSPF_LSA by area/type/ls_id/adv_router) and
+PRODUCTION_ROWS the number of rows each table reaches on a production
+switch. A lookup is covered when the columns of one of the table's
+'indexes', or of its 'idl_indexes' (the non-unique indexes that IDL
+clients build on their replica), are all part of the lookup key.
+UNIQUE_LOOKUPS lists the lookups that identify at most one row; the
+others, such as Neighbor by port, may match several rows and must not
+be covered by a new entry of 'indexes', which ovsdb-server enforces as
+a unique constraint. ALLOWED lists the lookups that are deliberately
+left uncovered, with the reason.
+
+Tables expected to hold at least --threshold rows with uncovered
+lookups are reported, together with the index to add: a compound
+'indexes' entry for unique lookups and an 'idl_indexes' entry for the
+others. They make the command exit with status 1 so that they are
+caught at build time.
+
+With --benchmark, synthetic rows are generated from the column types
+for every lookup at production scale (times --scale), and the time of a
+linear scan is compared with a lookup in a compound index built over
+the lookup key.
+'''
+
+import sys
+import time
+import random
+import argparse
+from collections import OrderedDict
+
+import extschema
+
+# Typical lookups per table, as tuples of columns.
+LOOKUPS = OrderedDict([
+    ('Route', [('vrf', 'from', 'prefix')]),
+    ('Nexthop', [('ip_address',)]),
+    ('Nexthop_Group', [('vrf', 'key')]),
+    ('BGP_Route', [('vrf', 'prefix', 'peer')]),
+    ('BGP_Neighbor', [('bgp_peer_group',)]),
+    ('MAC', [('bridge', 'vlan', 'from', 'mac_addr')]),
+    ('Neighbor', [('vrf', 'ip_address'), ('port',)]),
+    ('OSPF_LSA', [('area_id', 'lsa_type', 'ls_id', 'adv_router')]),
+    ('OSPF_Route', [('prefix', 'path_type')]),
+    ('OSPF_Neighbor', [('nbr_router_id',), ('nbr_if_addr',)]),
+    ('ACL_Entry', [('protocol', 'src_ip', 'dst_ip')]),
+    ('Route_Map_Entry', [('goto_target',), ('call',)]),
+    ('Prefix_List_Entry', [('prefix', 'ge', 'le')]),
+    ('MSTP_Instance_Port', [('port',)]),
+    ('MSTP_Common_Instance_Port', [('port',)]),
+])
+
+# Lookups that identify at most one row. The others may match several.
+UNIQUE_LOOKUPS = set([
+    ('Route', ('vrf', 'from', 'prefix')),
+    ('Nexthop_Group', ('vrf', 'key')),
+    ('BGP_Route', ('vrf', 'prefix', 'peer')),
+    ('MAC', ('bridge', 'vlan', 'from', 'mac_addr')),
+    ('Neighbor', ('vrf', 'ip_address')),
+])
+
+# Lookups left uncovered on purpose, with the reason.
+ALLOWED = {
+    ('ACL_Entry', ('protocol', 'src_ip', 'dst_ip')):
+        'entries are reached through ACL:cfg_aces, at most 512 per ACL',
+    ('Prefix_List_Entry', ('prefix', 'ge', 'le')):
+        'entries are reached through Prefix_List:prefix_list_entries and '
+        'matched by the compiled trie',
+}
+
+# Rows per table on a production switch.
+PRODUCTION_ROWS = {
+    'Route': 1000000,
+    'Nexthop': 800000,
+    'Nexthop_Group': 4096,
+    'BGP_Route': 2000000,
+    'BGP_Neighbor': 1024,
+    'MAC': 262144,
+    'Neighbor': 65536,
+    'OSPF_LSA': 100000,
+    'OSPF_Route': 100000,
+    'OSPF_Neighbor': 1024,
+    'ACL_Entry': 65536,
+    'Route_Map_Entry': 10000,
+    'Prefix_List_Entry': 100000,
+    'MSTP_Instance_Port': 8192,
+    'MSTP_Common_Instance_Port': 8192,
+}
+
+COVERED = 'covered'
+UNCOVERED = 'uncovered'
+ALLOW = 'allowed'
+
+
+def table_indexes(tabledef):
+    return [tuple(index) for index in tabledef.get('indexes', [])] + \
+        [tuple(index) for _, index in extschema.idl_indexes(tabledef)]
+
+
+def covering_index(tabledef, lookup):
+    '''
+    Returns the first index (or IDL index) of tabledef whose columns are
+    all part of lookup, or None.
+    '''
+    for index in table_indexes(tabledef):
+        if set(index) <= set(lookup):
+            return index
+    return None
+
+
+def check(schema, rows, threshold):
+    '''
+    Returns a list of (table, lookup, rows, status, index) for every
+    lookup of LOOKUPS whose table is in schema.
+    '''
+    results = []
+    for table, lookups in LOOKUPS.items():
+        tabledef = schema['tables'].get(table)
+        if tabledef is None:
+            continue
+        for lookup in lookups:
+            missing = [c for c in lookup if c not in tabledef['columns']]
+            if missing:
+                raise ValueError('%s has no column %s'
+                                 % (table, ', '.join(missing)))
+            index = covering_index(tabledef, lookup)
+            if index:
+                status = COVERED
+            elif (table, lookup) in ALLOWED:
+                status = ALLOW
+            else:
+                status = UNCOVERED
+            results.append((table, lookup, rows.get(table, 0), status,
+                            index))
+    return [r for r in results if r[2] >= threshold]
+
+
+class RowFactory(object):
+    '''
+    Generates synthetic values for a column from its type, with enough
+    distinct values for a table of nrows rows.
+    '''
+
+    def __init__(self, rng, nrows):
+        self.rng = rng
+        self.nrows = nrows
+        self.pools = {}
+
+    def _pool(self, name, size, make):
+        pool = self.pools.get(name)
+        if pool is None:
+            pool = self.pools[name] = [make(i) for i in range(size)]
+        return pool
+
+    def atom(self, column, base):
+        rng = self.rng
+        enum = base.get('enum')
+        if enum is not None:
+            values = enum[1] if isinstance(enum, list) else [enum]
+            return rng.choice(values)
+        atomic = base['type']
+        if atomic == 'boolean':
+            return rng.random() < 0.5
+        if atomic == 'integer':
+            lo = base.get('minInteger', 0)
+            hi = base.get('maxInteger', 2 ** 32 - 1)
+            return rng.randint(lo, hi)
+        if atomic == 'real':
+            return rng.uniform(base.get('minReal', 0.0),
+                               base.get('maxReal', 1e9))
+        if atomic == 'uuid':
+            pool = self._pool('uuid:%s' % base.get('refTable'),
+                              max(16, self.nrows // 8),
+                              lambda i: '%08x-0000-0000-0000-%012x'
+                              % (rng.getrandbits(32), i))
+            return rng.choice(pool)
+        value = rng.getrandbits(32)
+        if 'prefix' in column or 'ip' in column:
+            return '%d.%d.%d.%d/%d' % (value >> 24, (value >> 16) & 255,
+                                       (value >> 8) & 255, value & 255,
+                                       rng.randint(8, 32))
+        return '%s-%08x' % (column, value)
+
+    def row(self, tabledef, columns):
+        values = []
+        for column in columns:
+            coltype = extschema.column_type(tabledef['columns'][column])
+            values.append(self.atom(column, coltype.key))
+        return tuple(values)
+
+
+def _timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def benchmark(schema, table, lookup, nrows, queries=200, seed=0):
+    '''
+    Loads nrows synthetic rows of table and times queries lookups on
+    lookup with a linear scan and with a compound index. Returns an
+    OrderedDict with the timings, in seconds per lookup.
+    '''
+    rng = random.Random(seed)
+    tabledef = schema['tables'][table]
+    factory = RowFactory(rng, nrows)
+    rows = [factory.row(tabledef, lookup) for _ in range(nrows)]
+    keys = [rng.choice(rows) for _ in range(queries)]
+
+    def scan(keys):
+        found = 0
+        for key in keys:
+            for row in rows:
+                if row == key:
+                    found += 1
+        return found
+
+    def build():
+        index = {}
+        for row in rows:
+            index.setdefault(row, []).append(row)
+        return index
+
+    def probe(index, keys):
+        found = 0
+        for key in keys:
+            found += len(index.get(key, ()))
+        return found
+
+    # Linear scans are slow: time fewer of them at large scale.
+    scan_keys = keys[:max(1, min(queries, 20000000 // max(nrows, 1)))]
+    scan_time, scan_found = _timed(scan, scan_keys)
+    build_time, index = _timed(build)
+    probe_keys = keys * max(1, 10000 // len(keys))
+    probe_time, _ = _timed(probe, index, probe_keys)
+
+    scan_each = scan_time / len(scan_keys)
+    probe_each = max(probe_time / len(probe_keys), 1e-9)
+    return OrderedDict([
+        ('rows', nrows),
+        ('scan', scan_each),
+        ('index', probe_each),
+        ('build', build_time),
+        ('speedup', scan_each / probe_each),
+        ('distinct', len(index)),
+    ])
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Check index coverage of high-cardinality tables.')
+    parser.add_argument('schema')
+    parser.add_argument('--rows', action='append', metavar='TABLE=N',
+                        help='expected rows of TABLE (repeatable)')
+    parser.add_argument('--threshold', type=int, default=1000,
+                        help='rows from which a table needs an index for '
+                             'every lookup (default: 1000)')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='time lookups on synthetic rows')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='fraction of the production rows to load '
+                             'when benchmarking (default: 1.0)')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+#
+# main
+#
+def main(argv):
+    args = parse_args(argv)
+    schema = extschema.load(args.schema)
+
+    rows = dict(PRODUCTION_ROWS)
+    for spec in args.rows or []:
+        table, _, count = spec.partition('=')
+        rows[table] = int(count)
+
+    try:
+        results = check(schema, rows, args.threshold)
+    except ValueError as e:
+        print('indexcheck.py: %s' % e)
+        return 1
+
+    uncovered = 0
+    for table, lookup, nrows, status, index in results:
+        line = '%-10s %-26s %8d  (%s)' % (status, table, nrows,
+                                          ', '.join(lookup))
+        if status == COVERED:
+            idl = list(index) not in schema['tables'][table].get('indexes',
+                                                                 [])
+            line += ' by %sindex (%s)' % ('IDL ' if idl else '',
+                                          ', '.join(index))
+        elif status == ALLOW:
+            line += ': %s' % ALLOWED[(table, lookup)]
+        else:
+            uncovered += 1
+            if (table, lookup) in UNIQUE_LOOKUPS:
+                line += ' -> propose compound index %s' % list(lookup)
+            else:
+                line += ' -> propose IDL index %s' % list(lookup)
+        print(line)
+
+        if args.benchmark:
+            result = benchmark(schema, table, lookup,
+                               max(1, int(nrows * args.scale)),
+                               seed=args.seed)
+            print('           scan %.1f us, index %.2f us, speedup %.0fx '
+                  '(%d rows, %d keys, index built in %.2f s)'
+                  % (result['scan'] * 1e6, result['index'] * 1e6,
+                     result['speedup'], result['rows'], result['distinct'],
+                     result['build']))
+
+    print('%d lookups on large tables, %d not covered by an index'
+          % (len(results), uncovered))
+    return 1 if uncovered else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+'''
+Compiles the map keys documented in the schema XML, with their types
+and constraints, into a Python module of lookup tables.
+
+Usage:
+    keyvalidators.py input-schema input-xml output
+
+The generated module holds KEYS, {table: {column: {key: spec}}}, where
+spec is a (type, min, max, enum) tuple: min and max are minInteger and
+maxInteger (minReal/maxReal, minLength/maxLength) and enum a frozenset
+or None. Keys documented without a type take the value type of their
+column. check() and validate() use it to validate map keys in O(1) per
+key, so write paths (REST PUT/PATCH, declarative configuration) do not
+need to load the XML at runtime.
+'''
+
+import sys
+
+import extschema
+
+TYPES = ('integer', 'real', 'boolean', 'string', 'uuid')
+BOUNDS = {
+    'integer': ('minInteger', 'maxInteger'),
+    'real': ('minReal', 'maxReal'),
+    'string': ('minLength', 'maxLength'),
+}
+
+FUNCTIONS = """
+
+try:
+    STRING_TYPES = (str, unicode)
+except NameError:
+    STRING_TYPES = (str,)
+
+
+def _number(parse, value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return parse(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _check(spec, value):
+    kind, min_, max_, enum = spec
+    if kind == INTEGER or kind == REAL:
+        number = _number(int if kind == INTEGER else float, value)
+        if number is None:
+            return 'not %s' % ('an integer' if kind == INTEGER else 'a number')
+        if min_ is not None and number < min_:
+            return 'less than %s' % min_
+        if max_ is not None and number > max_:
+            return 'greater than %s' % max_
+        if enum is not None and number not in enum:
+            return 'not one of %s' % ', '.join('%s' % v for v in sorted(enum))
+    elif kind == BOOLEAN:
+        if value not in (True, False, 'true', 'false'):
+            return 'not a boolean'
+    elif kind == STRING:
+        if not isinstance(value, STRING_TYPES):
+            return 'not a string'
+        if min_ is not None and len(value) < min_:
+            return 'shorter than %d characters' % min_
+        if max_ is not None and len(value) > max_:
+            return 'longer than %d characters' % max_
+        if enum is not None and value not in enum:
+            return 'not one of %s' % ', '.join(sorted(enum))
+    return None
+
+
+def check(table, column, key, value):
+    '''
+    Returns None if value is valid for the key of column in table, or a
+    message saying why it is not. Undocumented keys are accepted.
+    '''
+    spec = KEYS.get(table, {}).get(column, {}).get(key)
+    if spec is None:
+        return None
+    error = _check(spec, value)
+    if error is None:
+        return None
+    return '%s:%s: "%s" is %s' % (column, key, value, error)
+
+
+def validate(table, column, mapping, strict=False):
+    '''
+    Validates every key of mapping (the value of a map column) and returns
+    the list of error messages. With strict, keys that are not documented
+    for a column that has documented keys are errors too.
+    '''
+    keys = KEYS.get(table, {}).get(column)
+    if keys is None:
+        return []
+    errors = []
+    for key, value in mapping.items():
+        spec = keys.get(key)
+        if spec is None:
+            if strict:
+                errors.append('%s:%s: unknown key' % (column, key))
+            continue
+        error = _check(spec, value)
+        if error is not None:
+            errors.append('%s:%s: "%s" is %s' % (column, key, value, error))
+    return errors
+"""
+
+
+def key_spec(base):
+    '''
+    Returns the source of the (type, min, max, enum) tuple for base.
+    '''
+    kind = base['type']
+    lo, hi = BOUNDS.get(kind, (None, None))
+    enum = base.get('enum')
+    if enum is not None:
+        values = enum[1] if isinstance(enum, list) else [enum]
+        enum = 'frozenset([%s])' % ', '.join(
+            "'%s'" % v if kind == 'string' else repr(v) for v in values)
+    return '(%s, %r, %r, %s)' % (kind.upper(), base.get(lo), base.get(hi),
+                                  enum)
+
+
+def generate(schema, keys, schema_name, xml_name):
+    out = ['# Generated from %s and %s by schema/keyvalidators.py.'
+           % (schema_name, xml_name),
+           '# Do not edit.', '']
+    out += ['%s = %d' % (t.upper(), i) for i, t in enumerate(TYPES)]
+    out += ['', '# {table: {column: {key: (type, min, max, enum)}}}',
+            'KEYS = {']
+    for table_name, columns in keys.items():
+        table = schema['tables'].get(table_name)
+        if table is None:
+            continue
+        out.append("    '%s': {" % table_name)
+        for column, column_keys in columns.items():
+            if column not in table['columns']:
+                continue
+            coltype = extschema.column_type(table['columns'][column])
+            if not coltype.is_map():
+                continue
+            out.append("        '%s': {" % column)
+            for key, info in column_keys.items():
+                if coltype.key['type'] == 'integer':
+                    try:
+                        literal = '%d' % int(key)
+                    except ValueError:
+                        continue
+                else:
+                    literal = "'%s'" % key
+                base = extschema.base_type(info['type']) or coltype.value
+                out.append('            %s: %s,' % (literal, key_spec(base)))
+            out.append('        },')
+        out.append('    },')
+    out.append('}')
+    return '\n'.join(out) + FUNCTIONS
+
+
+#
+# main
+#
+def main(argv):
+    if len(argv) != 3:
+        print("Usage: keyvalidators.py input-schema input-xml output")
+        return 1
+    orig_schema, xml, output = argv
+
+    text = generate(extschema.load(orig_schema), extschema.load_keys(xml),
+                    orig_schema.split('/')[-1], xml.split('/')[-1])
+    with open(output, 'w') as fp:
+        fp.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
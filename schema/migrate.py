@@ -0,0 +1,511 @@
+#!/usr/bin/env python
+'''
+Compares two extended schemas and plans the minimal database migration
+between them.
+
+Usage:
+    migrate.py [--plan plan-file] [--all] old-schema new-schema
+
+Every difference is reported at table, column, index or constraint level
+and classified as either compatible (existing rows are valid as they are
+under new-schema) or needing conversion. Changes to the annotations that
+are stripped before the schema is loaded into ovsdb-server
+(sanitize.DROP_KEYS: category, relationship, replication, publish and
+idl_indexes) are always compatible.
+
+The migration plan lists only the tables that need conversion, together
+with the per-column actions to apply to their rows; every other table is
+kept as it is. convert_row() applies a table's actions to one row in
+OVSDB JSON wire format, so an upgrade only rewrites the affected tables
+instead of dumping and reloading the whole database.
+'''
+
+import sys
+import json
+import argparse
+from collections import namedtuple, OrderedDict
+
+import extschema
+import sanitize
+
+COMPATIBLE = 'compatible'
+CONVERT = 'convert'
+
+# Column actions in a migration plan.
+ACTION_DROP = 'drop'        # column removed, discard its data
+ACTION_DEFAULT = 'default'  # column added, default value needs checking
+ACTION_RETYPE = 'retype'    # atomic type changed, coerce every atom
+ACTION_FILTER = 'filter'    # constraints narrowed, drop invalid data
+
+Change = namedtuple('Change', 'level table column what status detail')
+
+# Annotations stripped by sanitize.py, unknown to ovsdb-server.
+ANNOTATIONS = sanitize.DROP_KEYS
+INTEGER_BOUNDS = (('minInteger', 'maxInteger'), ('minReal', 'maxReal'),
+                  ('minLength', 'maxLength'))
+UUID_ZERO = '00000000-0000-0000-0000-000000000000'
+
+try:
+    STRING_TYPES = (str, unicode)
+    INTEGER_TYPES = (int, long)
+except NameError:
+    STRING_TYPES = (str,)
+    INTEGER_TYPES = (int,)
+
+
+def _max(value):
+    return float('inf') if value == extschema.UNLIMITED else value
+
+
+def _enum_values(base):
+    enum = base.get('enum')
+    if enum is None:
+        return None
+    if isinstance(enum, list) and enum and enum[0] == 'set':
+        return set(enum[1])
+    return set([enum])
+
+
+def _base_changes(base_old, base_new, which):
+    '''
+    Yields (what, status, detail) for the differences between two base
+    types of a column ('key' or 'value').
+    '''
+    if base_old['type'] != base_new['type']:
+        yield ('%s type' % which, CONVERT,
+               '%s -> %s' % (base_old['type'], base_new['type']))
+        return
+
+    for lo, hi in INTEGER_BOUNDS:
+        old_lo, new_lo = base_old.get(lo), base_new.get(lo)
+        if old_lo != new_lo:
+            narrowed = new_lo is not None and \
+                (old_lo is None or new_lo > old_lo)
+            yield ('%s %s' % (which, lo), CONVERT if narrowed else COMPATIBLE,
+                   '%s -> %s' % (old_lo, new_lo))
+        old_hi, new_hi = base_old.get(hi), base_new.get(hi)
+        if old_hi != new_hi:
+            narrowed = new_hi is not None and \
+                (old_hi is None or new_hi < old_hi)
+            yield ('%s %s' % (which, hi), CONVERT if narrowed else COMPATIBLE,
+                   '%s -> %s' % (old_hi, new_hi))
+
+    old_enum, new_enum = _enum_values(base_old), _enum_values(base_new)
+    if old_enum != new_enum:
+        if new_enum is None:
+            yield ('%s enum' % which, COMPATIBLE, 'enum removed')
+        elif old_enum is None:
+            yield ('%s enum' % which, CONVERT, 'enum added')
+        else:
+            removed = sorted(old_enum - new_enum)
+            added = sorted(new_enum - old_enum)
+            detail = []
+            if added:
+                detail.append('added %s' % ', '.join(map(str, added)))
+            if removed:
+                detail.append('removed %s' % ', '.join(map(str, removed)))
+            yield ('%s enum' % which, CONVERT if removed else COMPATIBLE,
+                   '; '.join(detail))
+
+    if base_old.get('refTable') != base_new.get('refTable'):
+        yield ('%s refTable' % which, CONVERT, '%s -> %s'
+               % (base_old.get('refTable'), base_new.get('refTable')))
+    elif base_old.get('refType', 'strong') != base_new.get('refType',
+                                                           'strong'):
+        yield ('%s refType' % which, COMPATIBLE, '%s -> %s'
+               % (base_old.get('refType', 'strong'),
+                  base_new.get('refType', 'strong')))
+
+
+def _type_changes(old, new):
+    '''
+    Yields (what, status, detail) for the differences between two
+    normalized column types.
+    '''
+    if old.is_map() != new.is_map():
+        yield ('kind', CONVERT, '%s -> %s' % (old.kind(), new.kind()))
+        return
+
+    for change in _base_changes(old.key, new.key, 'key'):
+        yield change
+    if old.is_map():
+        for change in _base_changes(old.value, new.value, 'value'):
+            yield change
+
+    if old.min != new.min:
+        yield ('min', CONVERT if new.min > old.min else COMPATIBLE,
+               '%s -> %s' % (old.min, new.min))
+    if old.max != new.max:
+        yield ('max', CONVERT if _max(new.max) < _max(old.max) else COMPATIBLE,
+               '%s -> %s' % (old.max, new.max))
+
+
+def default_atom(base):
+    '''
+    Returns the OVSDB default atom for a base type, in JSON wire format.
+    '''
+    return {
+        'integer': 0,
+        'real': 0.0,
+        'boolean': False,
+        'string': '',
+        'uuid': ['uuid', UUID_ZERO],
+    }[base['type']]
+
+
+def atom_is_valid(base, atom):
+    '''
+    Checks atom (JSON wire format) against the constraints of base.
+    '''
+    atomic = base['type']
+    if atomic == 'uuid':
+        return isinstance(atom, list) and len(atom) == 2 and \
+            atom[0] in ('uuid', 'named-uuid')
+    if atomic == 'boolean':
+        return isinstance(atom, bool)
+    if atomic == 'string':
+        if not isinstance(atom, STRING_TYPES):
+            return False
+        if len(atom) < base.get('minLength', 0) or \
+                len(atom) > base.get('maxLength', float('inf')):
+            return False
+    elif atomic in ('integer', 'real'):
+        types = INTEGER_TYPES + (float,) if atomic == 'real' \
+            else INTEGER_TYPES
+        if isinstance(atom, bool) or not isinstance(atom, types):
+            return False
+        lo, hi = ('minInteger', 'maxInteger') if atomic == 'integer' \
+            else ('minReal', 'maxReal')
+        if atom < base.get(lo, float('-inf')) or \
+                atom > base.get(hi, float('inf')):
+            return False
+    enum = _enum_values(base)
+    return enum is None or atom in enum
+
+
+def default_datum(coltype):
+    '''
+    Returns the OVSDB default datum for a column type: the empty set or
+    map if min is 0, otherwise the default atom (or key/value pair).
+    '''
+    if coltype.min == 0:
+        return ['map', []] if coltype.is_map() else ['set', []]
+    if coltype.is_map():
+        return ['map', [[default_atom(coltype.key),
+                         default_atom(coltype.value)]]]
+    return default_atom(coltype.key)
+
+
+def _fill_atom(base):
+    enum = _enum_values(base)
+    if enum:
+        atom = sorted(enum)[0]
+    else:
+        atom = default_atom(base)
+        for lo, hi in INTEGER_BOUNDS[:2]:
+            if lo in base:
+                atom = max(atom, base[lo])
+            if hi in base:
+                atom = min(atom, base[hi])
+    if not atom_is_valid(base, atom) or base['type'] == 'uuid':
+        raise ValueError('no valid default value for %s' % json.dumps(base))
+    return atom
+
+
+def fill_datum(coltype):
+    '''
+    Returns the smallest datum that satisfies coltype: the OVSDB default
+    when it is valid, otherwise the default atoms moved into range (or the
+    first enum value). Raises ValueError when no such value can be made
+    up, e.g. for a mandatory reference.
+    '''
+    if coltype.min == 0:
+        return default_datum(coltype)
+    if coltype.is_map():
+        return ['map', [[_fill_atom(coltype.key),
+                         _fill_atom(coltype.value)]]]
+    return _fill_atom(coltype.key)
+
+
+def default_is_valid(coltype):
+    '''
+    Tells whether rows that predate a column can keep its default value.
+    A non-empty default uuid is never a valid reference.
+    '''
+    if coltype.min == 0:
+        return True
+    if 'uuid' in (coltype.key['type'], (coltype.value or {}).get('type')):
+        return False
+    return atom_is_valid(coltype.key, default_atom(coltype.key)) and \
+        (not coltype.is_map() or
+         atom_is_valid(coltype.value, default_atom(coltype.value)))
+
+
+def _coerce_atom(base, atom):
+    if atom_is_valid(base, atom):
+        return atom
+    atomic = base['type']
+    try:
+        if atomic == 'string' and not isinstance(atom, list):
+            atom = json.dumps(atom) if isinstance(atom, bool) else str(atom)
+        elif atomic == 'integer':
+            atom = int(atom)
+        elif atomic == 'real':
+            atom = float(atom)
+        elif atomic == 'boolean' and atom in ('true', 'false'):
+            atom = atom == 'true'
+    except (TypeError, ValueError):
+        return None
+    return atom if atom_is_valid(base, atom) else None
+
+
+def _convert_datum(coltype, datum, coerce):
+    '''
+    Returns datum with every element that does not satisfy coltype removed
+    (after coercion to the new atomic type when coerce is set). Falls back
+    to fill_datum() when what is left has too few elements.
+    '''
+    fix = _coerce_atom if coerce else \
+        (lambda base, atom: atom if atom_is_valid(base, atom) else None)
+
+    if coltype.is_map():
+        pairs = datum[1] if isinstance(datum, list) and datum and \
+            datum[0] == 'map' else []
+        elems = []
+        for key, value in pairs:
+            key, value = fix(coltype.key, key), fix(coltype.value, value)
+            if key is not None and value is not None:
+                elems.append([key, value])
+    else:
+        atoms = datum[1] if isinstance(datum, list) and datum and \
+            datum[0] == 'set' else [datum]
+        elems = [a for a in (fix(coltype.key, atom) for atom in atoms)
+                 if a is not None]
+
+    if len(elems) > _max(coltype.max):
+        elems = elems[:coltype.max]
+    if len(elems) < coltype.min:
+        return fill_datum(coltype)
+    if coltype.is_map():
+        return ['map', elems]
+    if len(elems) == 1 and coltype.max == 1:
+        return elems[0]
+    return ['set', elems]
+
+
+def convert_row(table_plan, row):
+    '''
+    Applies the column actions of one table of a migration plan to row, a
+    dict of column name to datum in OVSDB JSON wire format. Returns the
+    converted row; columns the plan does not mention are left untouched.
+    Raises ValueError if a mandatory column cannot be given a valid value.
+    '''
+    row = dict(row)
+    for column, action in table_plan.get('columns', {}).items():
+        if action['action'] == ACTION_DROP:
+            row.pop(column, None)
+            continue
+        coltype = extschema.ColumnType(action['type'])
+        if column not in row:
+            row[column] = fill_datum(coltype)
+        else:
+            row[column] = _convert_datum(coltype, row[column],
+                                         action['action'] == ACTION_RETYPE)
+    return row
+
+
+def diff(old, new):
+    '''
+    Returns the list of Changes between two schemas, as loaded by
+    extschema.load.
+    '''
+    changes = []
+
+    def add(level, table, column, what, status, detail=''):
+        changes.append(Change(level, table, column, what, status, detail))
+
+    if old.get('version') != new.get('version'):
+        add('schema', None, None, 'version', COMPATIBLE,
+            '%s -> %s' % (old.get('version'), new.get('version')))
+
+    old_tables, new_tables = old['tables'], new['tables']
+    for table in old_tables:
+        if table not in new_tables:
+            add('table', table, None, 'removed', CONVERT)
+    for table in new_tables:
+        if table not in old_tables:
+            add('table', table, None, 'added', COMPATIBLE)
+
+    for table in old_tables:
+        if table not in new_tables:
+            continue
+        old_table, new_table = old_tables[table], new_tables[table]
+
+        if old_table.get('isRoot', False) != new_table.get('isRoot', False):
+            add('table', table, None, 'isRoot',
+                COMPATIBLE if new_table.get('isRoot') else CONVERT,
+                '%s -> %s' % (old_table.get('isRoot', False),
+                              new_table.get('isRoot', False)))
+        old_rows = old_table.get('maxRows', float('inf'))
+        new_rows = new_table.get('maxRows', float('inf'))
+        if old_rows != new_rows:
+            add('table', table, None, 'maxRows',
+                CONVERT if new_rows < old_rows else COMPATIBLE,
+                '%s -> %s' % (old_table.get('maxRows'),
+                              new_table.get('maxRows')))
+
+        old_indexes = [tuple(i) for i in old_table.get('indexes', [])]
+        new_indexes = [tuple(i) for i in new_table.get('indexes', [])]
+        for index in old_indexes:
+            if index not in new_indexes:
+                add('index', table, None, 'removed', COMPATIBLE,
+                    ', '.join(index))
+        for index in new_indexes:
+            if index not in old_indexes:
+                add('index', table, None, 'added', CONVERT, ', '.join(index))
+
+        for key in ANNOTATIONS:
+            if old_table.get(key) != new_table.get(key):
+                add('annotation', table, None, key, COMPATIBLE,
+                    '%s -> %s' % (json.dumps(old_table.get(key)),
+                                  json.dumps(new_table.get(key))))
+
+        old_cols, new_cols = old_table['columns'], new_table['columns']
+        for column in old_cols:
+            if column not in new_cols:
+                add('column', table, column, 'removed', CONVERT)
+        for column in new_cols:
+            if column in old_cols:
+                continue
+            coltype = extschema.column_type(new_cols[column])
+            add('column', table, column, 'added',
+                COMPATIBLE if default_is_valid(coltype) else CONVERT)
+
+        for column in old_cols:
+            if column not in new_cols:
+                continue
+            old_col, new_col = old_cols[column], new_cols[column]
+            for key in ANNOTATIONS:
+                if old_col.get(key) != new_col.get(key):
+                    add('annotation', table, column, key, COMPATIBLE,
+                        '%s -> %s' % (json.dumps(old_col.get(key)),
+                                      json.dumps(new_col.get(key))))
+            for key, default in (('mutable', True), ('ephemeral', False)):
+                if old_col.get(key, default) != new_col.get(key, default):
+                    add('column', table, column, key, COMPATIBLE,
+                        '%s -> %s' % (old_col.get(key, default),
+                                      new_col.get(key, default)))
+            for what, status, detail in _type_changes(
+                    extschema.column_type(old_col),
+                    extschema.column_type(new_col)):
+                add('constraint', table, column, what, status, detail)
+
+    return changes
+
+
+def plan(old, new, changes):
+    '''
+    Builds the migration plan for changes (as returned by diff): the
+    tables to create, drop and convert, with per-column actions for the
+    converted ones. Tables that are not mentioned are kept as they are.
+    '''
+    tables = OrderedDict()
+
+    def table_plan(table, action='convert'):
+        return tables.setdefault(table, OrderedDict(
+            [('action', action), ('columns', OrderedDict()),
+             ('verify_indexes', [])]))
+
+    for change in changes:
+        if change.level == 'table' and change.what == 'added':
+            tables[change.table] = OrderedDict([('action', 'create')])
+        elif change.level == 'table' and change.what == 'removed':
+            tables[change.table] = OrderedDict([('action', 'drop')])
+
+    for change in changes:
+        if change.status != CONVERT or \
+                tables.get(change.table, {}).get('action') in ('create',
+                                                               'drop'):
+            continue
+        tp = table_plan(change.table)
+        if change.level == 'index':
+            tp['verify_indexes'].append(change.detail.split(', '))
+        elif change.level == 'table':
+            tp.setdefault('notes', []).append(
+                '%s %s' % (change.what, change.detail))
+        elif change.level == 'column' and change.what == 'removed':
+            tp['columns'][change.column] = OrderedDict(
+                [('action', ACTION_DROP)])
+        else:
+            coltype = new['tables'][change.table]['columns'][change.column][
+                'type']
+            if change.level == 'column':
+                action = ACTION_DEFAULT
+            elif change.what in ('key type', 'value type', 'kind'):
+                action = ACTION_RETYPE
+            else:
+                action = ACTION_FILTER
+            current = tp['columns'].get(change.column)
+            if current is None or current['action'] == ACTION_FILTER:
+                tp['columns'][change.column] = OrderedDict(
+                    [('action', action), ('type', coltype)])
+
+    return OrderedDict([
+        ('from', old.get('version')),
+        ('to', new.get('version')),
+        ('tables', tables),
+        ('unchanged', [t for t in new['tables']
+                       if t in old['tables'] and t not in tables]),
+    ])
+
+
+def report(changes, show_all):
+    for change in changes:
+        if change.status == COMPATIBLE and not show_all:
+            continue
+        name = '.'.join(n for n in (change.table, change.column) if n)
+        print('%-10s %-10s %-40s %s %s' % (
+            change.status, change.level, name or '-', change.what,
+            '(%s)' % change.detail if change.detail else ''))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Plan the migration between two extended schemas.')
+    parser.add_argument('--plan', metavar='FILE',
+                        help='write the JSON migration plan to FILE')
+    parser.add_argument('--all', action='store_true',
+                        help='also list compatible changes')
+    parser.add_argument('old_schema')
+    parser.add_argument('new_schema')
+    return parser.parse_args(argv)
+
+
+#
+# main
+#
+def main(argv):
+    args = parse_args(argv)
+    old = extschema.load(args.old_schema)
+    new = extschema.load(args.new_schema)
+
+    changes = diff(old, new)
+    migration = plan(old, new, changes)
+
+    report(changes, args.all)
+    converted = [t for t, p in migration['tables'].items()
+                 if p['action'] == 'convert']
+    print('%d changes, %d need conversion; %d tables to convert, '
+          '%d unchanged' % (len(changes),
+                            len([c for c in changes if c.status == CONVERT]),
+                            len(converted), len(migration['unchanged'])))
+
+    if args.plan:
+        with open(args.plan, 'w') as fp:
+            json.dump(migration, fp, indent=2, separators=(',', ': '))
+            fp.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+'''
+Compiles Prefix_List entries into a binary trie, with a cache shared by
+the consumers of the lists, and benchmarks it against entry-by-entry
+matching.
+
+Usage:
+    prefixlist.py [--list FILE] [--table FILE] [--entries N] [--routes N]
+                  [--seed S]
+
+A prefix list is {preference: entry}, where entry holds the
+Prefix_List_Entry columns action, prefix ("A.B.C.D/L", "X:X::X:X/L" or
+"any"), ge and le. A route prefix P/N matches an entry for prefix E/L
+when the first L bits of P and E are equal and N is within the length
+range of the entry: [L, L] without ge and le, [ge, max] with ge only,
+[L, le] with le only and [ge, le] with both, max being 32 or 128. "any"
+matches every prefix of both families. The entry with the lowest
+preference that matches decides; a route that matches no entry is
+denied.
+
+The trie has one root per family. Every entry is stored at the node of
+its prefix, and every node keeps, for each route prefix length, the
+(preference, action) of the lowest-preference entry of the node that
+accepts that length. Matching P/N walks the N bits of P from the root
+and keeps the lowest preference found on the way, so it costs at most N
+steps whatever the number of entries.
+
+PrefixListCache keeps one compiled trie per list and recompiles a list
+only when its Prefix_List:cfg_version changes, so that route-maps and
+redistribution share the same compiled lists.
+
+--table loads route prefixes from a file, one per line; otherwise a
+synthetic IPv4 Internet table of --routes prefixes is generated. --list
+loads a prefix list from a JSON file in the above format; otherwise a
+synthetic list of --entries entries, half of them drawn from the table,
+is generated. Linear matching is timed on a sample of the table.
+'''
+
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import binascii
+
+PERMIT = 'permit'
+DENY = 'deny'
+ANY = 'any'
+
+BITS = {socket.AF_INET: 32, socket.AF_INET6: 128}
+
+
+def parse_prefix(text):
+    '''
+    Returns (family, address, length) for "A.B.C.D/L" or "X:X::X:X/L",
+    address being an integer with the host bits cleared.
+    '''
+    address, _, length = text.strip().partition('/')
+    family = socket.AF_INET6 if ':' in address else socket.AF_INET
+    bits = BITS[family]
+    value = int(binascii.hexlify(socket.inet_pton(family, address)), 16)
+    length = int(length) if length else bits
+    if not 0 <= length <= bits:
+        raise ValueError('"%s": invalid prefix length' % text)
+    return family, value & ~((1 << (bits - length)) - 1), length
+
+
+def length_range(length, bits, ge=None, le=None):
+    '''
+    Returns the (low, high) range of route prefix lengths accepted by an
+    entry of the given prefix length, ge and le.
+    '''
+    if ge is None and le is None:
+        return length, length
+    low = max(length, ge) if ge is not None else length
+    high = le if le is not None else bits
+    return low, high
+
+
+class Entry(object):
+    '''
+    A Prefix_List_Entry with its prefix parsed.
+    '''
+
+    __slots__ = ('preference', 'action', 'prefixes', 'lengths')
+
+    def __init__(self, preference, entry):
+        self.preference = preference
+        self.action = entry['action']
+        if entry['prefix'] == ANY:
+            self.prefixes = [(family, 0, 0) for family in sorted(BITS)]
+            self.lengths = dict((family, (0, bits))
+                                for family, bits in BITS.items())
+        else:
+            family, address, length = parse_prefix(entry['prefix'])
+            self.prefixes = [(family, address, length)]
+            self.lengths = {family: length_range(
+                length, BITS[family], entry.get('ge'), entry.get('le'))}
+
+    def matches(self, family, address, length):
+        for entry_family, prefix, prefix_length in self.prefixes:
+            if entry_family != family:
+                continue
+            low, high = self.lengths[family]
+            shift = BITS[family] - prefix_length
+            return low <= length <= high and \
+                address >> shift == prefix >> shift
+        return False
+
+
+def linear_match(entries, family, address, length):
+    '''
+    Returns (preference, action) of the first of entries, a list of Entry
+    in preference order, that matches the route prefix, or None.
+    '''
+    for entry in entries:
+        if entry.matches(family, address, length):
+            return entry.preference, entry.action
+    return None
+
+
+class Node(object):
+    '''
+    A trie node: children[bit] is the node one bit deeper, and best, when
+    entries end here, maps a route prefix length to (preference, action).
+    '''
+
+    __slots__ = ('children', 'best')
+
+    def __init__(self):
+        self.children = [None, None]
+        self.best = None
+
+
+class PrefixList(object):
+    '''
+    Compiled prefix list.
+    '''
+
+    def __init__(self, prefix_list):
+        self.roots = dict((family, Node()) for family in BITS)
+        self.nodes = len(self.roots)
+        self.entries = len(prefix_list)
+        for preference in sorted(prefix_list):
+            self._insert(Entry(preference, prefix_list[preference]))
+
+    def _insert(self, entry):
+        for family, address, length in entry.prefixes:
+            bits = BITS[family]
+            node = self.roots[family]
+            for depth in range(length):
+                bit = (address >> (bits - 1 - depth)) & 1
+                if node.children[bit] is None:
+                    node.children[bit] = Node()
+                    self.nodes += 1
+                node = node.children[bit]
+            if node.best is None:
+                node.best = {}
+            low, high = entry.lengths[family]
+            for route_length in range(low, high + 1):
+                # Entries are inserted in preference order: the first one
+                # that accepts a length keeps it.
+                node.best.setdefault(route_length,
+                                     (entry.preference, entry.action))
+
+    def match(self, family, address, length):
+        '''
+        Returns (preference, action) of the first entry that matches the
+        route prefix, or None.
+        '''
+        bits = BITS[family]
+        node = self.roots[family]
+        best = None
+        depth = 0
+        while True:
+            if node.best is not None:
+                found = node.best.get(length)
+                if found is not None and (best is None or found < best):
+                    best = found
+            if depth == length:
+                return best
+            node = node.children[(address >> (bits - 1 - depth)) & 1]
+            if node is None:
+                return best
+            depth += 1
+
+    def permits(self, family, address, length):
+        found = self.match(family, address, length)
+        return found is not None and found[1] == PERMIT
+
+
+class PrefixListCache(object):
+    '''
+    Compiled prefix lists by name, shared by every consumer (route-map
+    "match ip address prefix-list", redistribution filters, ...).
+    '''
+
+    def __init__(self):
+        self.lists = {}
+        self.hits = 0
+        self.compilations = 0
+
+    def get(self, name, version, load):
+        '''
+        Returns the compiled list for name at cfg_version version. load()
+        returns its {preference: entry} and is only called when the list
+        has to be compiled.
+        '''
+        cached = self.lists.get(name)
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            return cached[1]
+        compiled = PrefixList(load())
+        self.lists[name] = (version, compiled)
+        self.compilations += 1
+        return compiled
+
+    def invalidate(self, name):
+        self.lists.pop(name, None)
+
+
+def _format(address, length):
+    return '%d.%d.%d.%d/%d' % (address >> 24, (address >> 16) & 255,
+                               (address >> 8) & 255, address & 255, length)
+
+
+def synthetic_table(count, rng):
+    '''
+    Returns count IPv4 route prefixes with a length distribution close to
+    the Internet table: mostly /24, then /22-/23 and /16-/21.
+    '''
+    lengths = [24] * 60 + [23] * 8 + [22] * 10 + [21] * 5 + [20] * 5 + \
+        [19] * 4 + [16] * 4 + [18] * 2 + [17] * 2
+    routes = []
+    for _ in range(count):
+        length = rng.choice(lengths)
+        address = rng.randint(1 << 24, 223 << 24) & \
+            ~((1 << (32 - length)) - 1)
+        routes.append((socket.AF_INET, address, length))
+    return routes
+
+
+def synthetic_list(entries, routes, rng):
+    '''
+    Returns a prefix list of entries entries: exact prefixes of the table,
+    aggregates with le, and more-specifics filters with ge.
+    '''
+    prefix_list = {}
+    for i in range(entries):
+        entry = {'action': rng.choice((PERMIT, PERMIT, DENY))}
+        if rng.random() < 0.5:
+            _, address, length = rng.choice(routes)
+            entry['prefix'] = _format(address, length)
+        else:
+            length = rng.choice((8, 12, 16, 16, 19, 20))
+            address = rng.randint(1 << 24, 223 << 24) & \
+                ~((1 << (32 - length)) - 1)
+            entry['prefix'] = _format(address, length)
+            if rng.random() < 0.5:
+                entry['le'] = 24
+            else:
+                entry['ge'] = 25
+        prefix_list[(i + 1) * 5] = entry
+    return prefix_list
+
+
+def _timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def benchmark(prefix_list, routes):
+    '''
+    Returns a dict of timings, in seconds, and the number of routes on
+    which the trie and linear matching disagree.
+    '''
+    compile_time, compiled = _timed(PrefixList, prefix_list)
+    match_time, matched = _timed(
+        lambda: [compiled.match(*route) for route in routes])
+
+    entries = [Entry(p, prefix_list[p]) for p in sorted(prefix_list)]
+    sample = routes[:max(1, min(len(routes),
+                                20000000 // max(len(entries), 1)))]
+    linear_time, linear = _timed(
+        lambda: [linear_match(entries, *route) for route in sample])
+
+    return {
+        'entries': len(prefix_list),
+        'routes': len(routes),
+        'nodes': compiled.nodes,
+        'permitted': sum(1 for m in matched if m and m[1] == PERMIT),
+        'compile': compile_time,
+        'match': match_time,
+        'trie': match_time / len(routes),
+        'linear': linear_time / len(sample),
+        'mismatches': sum(1 for a, b in zip(matched, linear) if a != b),
+    }
+
+
+def load_table(path):
+    with open(path) as fp:
+        return [parse_prefix(line) for line in fp if line.strip()]
+
+
+def load_list(path):
+    with open(path) as fp:
+        return dict((int(preference), entry)
+                    for preference, entry in json.load(fp).items())
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmark compiled prefix lists.')
+    parser.add_argument('--list', metavar='FILE',
+                        help='JSON object of preference to entry')
+    parser.add_argument('--table', metavar='FILE',
+                        help='route prefixes, one per line')
+    parser.add_argument('--entries', type=int, default=10000,
+                        help='entries of the synthetic list '
+                        '(default: 10000)')
+    parser.add_argument('--routes', type=int, default=100000,
+                        help='prefixes of the synthetic table '
+                        '(default: 100000)')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+#
+# main
+#
+def main(argv):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    try:
+        routes = load_table(args.table) if args.table else \
+            synthetic_table(args.routes, rng)
+    except ValueError as e:
+        print('prefixlist.py: %s' % e)
+        return 1
+    prefix_list = load_list(args.list) if args.list else \
+        synthetic_list(args.entries, routes, rng)
+
+    result = benchmark(prefix_list, routes)
+    print('%d entries, %d trie nodes, compiled in %.3f s'
+          % (result['entries'], result['nodes'], result['compile']))
+    print('%d routes matched in %.3f s, %d permitted'
+          % (result['routes'], result['match'], result['permitted']))
+    print('trie %.1f us/route, linear %.1f us/route, speedup %.0fx'
+          % (result['trie'] * 1e6, result['linear'] * 1e6,
+             result['linear'] / max(result['trie'], 1e-9)))
+    if result['mismatches']:
+        print('%d routes matched differently' % result['mismatches'])
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
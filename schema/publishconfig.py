@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+'''
+Exports the "publish" annotations of an extended schema as the
+configuration that statistics publishers use to rate-limit and batch
+their writes.
+
+Usage:
+    publishconfig.py --format json|c-header [--prefix P] input-schema output
+
+A column annotated with
+
+    "publish": {"min_interval": 1000, "coalesce": 500}
+
+is written at most once every min_interval milliseconds per row: the
+period of the column is the larger of min_interval and
+System:other_config:stats-update-interval, so min_interval is a floor
+that the global interval can still raise. The updates of all the rows
+that fall due within the same coalesce milliseconds are written in a
+single transaction. Both values are optional; columns without the
+annotation follow the global interval.
+
+The JSON output maps table to column to the annotation. The C header
+defines <PREFIX>_PUBLISH_<TABLE>_<COLUMN>_MIN_INTERVAL and
+..._COALESCE for every annotated column.
+'''
+
+import sys
+import json
+import argparse
+from collections import OrderedDict
+
+import extschema
+
+PUBLISH_KEYS = ('min_interval', 'coalesce')
+
+
+def publish_config(schema):
+    '''
+    Returns {table: {column: {'min_interval': ms, 'coalesce': ms}}} for
+    the annotated columns of schema. Raises ValueError for malformed
+    annotations.
+    '''
+    config = OrderedDict()
+    for table, column, coldef in extschema.iter_columns(schema):
+        publish = coldef.get('publish')
+        if publish is None:
+            continue
+        name = '%s.%s' % (table, column)
+        if not isinstance(publish, dict) or not publish:
+            raise ValueError('%s: "publish" must be a non-empty object' % name)
+        for key, value in publish.items():
+            if key not in PUBLISH_KEYS:
+                raise ValueError('%s: unknown "publish" key "%s"'
+                                 % (name, key))
+            if isinstance(value, bool) or not isinstance(value, int) or \
+                    value <= 0:
+                raise ValueError('%s: "publish" %s must be a positive '
+                                 'number of milliseconds' % (name, key))
+        if publish.get('coalesce', 0) > publish.get('min_interval',
+                                                    float('inf')):
+            raise ValueError('%s: "publish" coalesce is longer than '
+                             'min_interval' % name)
+        config.setdefault(table, OrderedDict())[column] = OrderedDict(
+            (key, publish[key]) for key in PUBLISH_KEYS if key in publish)
+    return config
+
+
+def c_header(config, prefix, source):
+    guard = '%s_PUBLISH_H' % prefix.upper()
+    out = ['/* Generated from %s by schema/publishconfig.py. Do not edit. */'
+           % source, '',
+           '#ifndef %s' % guard, '#define %s 1' % guard, '',
+           '/* Publishing intervals, in milliseconds, of the columns with a',
+           ' * "publish" annotation. */']
+    for table, columns in config.items():
+        for column, publish in columns.items():
+            for key, value in publish.items():
+                out.append('#define %s_PUBLISH_%s_%s_%s %d'
+                           % (prefix.upper(), table.upper(), column.upper(),
+                              key.upper(), value))
+    out += ['', '#endif /* %s */' % guard]
+    return '\n'.join(out) + '\n'
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Export the "publish" schema annotations.')
+    parser.add_argument('--format', required=True,
+                        choices=('json', 'c-header'))
+    parser.add_argument('--prefix', default='ovsrec',
+                        help='C macro prefix (default: ovsrec)')
+    parser.add_argument('input_schema')
+    parser.add_argument('output')
+    return parser.parse_args(argv)
+
+
+#
+# main
+#
+def main(argv):
+    args = parse_args(argv)
+    try:
+        config = publish_config(extschema.load(args.input_schema))
+    except ValueError as e:
+        print('publishconfig.py: %s' % e)
+        return 1
+
+    if args.format == 'json':
+        text = json.dumps(config, indent=2, separators=(',', ': ')) + '\n'
+    else:
+        text = c_header(config, args.prefix,
+                        args.input_schema.split('/')[-1])
+
+    with open(args.output, 'w') as fp:
+        fp.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
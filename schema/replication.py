@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+'''
+Generates the IDL column registration table from the "replication"
+annotations of an extended schema.
+
+Usage:
+    replication.py --format c-header|c-source|python [--prefix P] \\
+        input-schema output
+
+Every column has one of the REPLICATION_MODES ("monitored" when the
+column has no annotation). The generated C code registers all the
+columns of a table with ovsdb_idl_add_column() or
+ovsdb_idl_add_on_demand_column() according to their mode, and the
+generated Python module registers the monitored ones with a
+SchemaHelper. Daemons call these instead of hand-picking columns.
+
+The "idl_indexes" of a table (lists of columns) are created, in
+ascending order and with the default comparators, when the table is
+registered from C, so that daemons can look rows up with the
+OVSREC_<TABLE>_FOR_EACH_EQUAL/RANGE cursors of the "by_<columns>"
+index. The Python module lists them in IDL_INDEXES.
+'''
+
+import os
+import sys
+import argparse
+
+import extschema
+
+MONITORED = 'monitored'
+ON_DEMAND = 'on_demand'
+EPHEMERAL_STREAM = 'ephemeral_stream'
+REPLICATION_MODES = (MONITORED, ON_DEMAND, EPHEMERAL_STREAM)
+
+BANNER = 'Generated from %s by schema/replication.py. Do not edit.'
+
+
+def column_modes(schema):
+    '''
+    Returns [(table, [(column, mode), ...], [(index, [column, ...]), ...]),
+    ...] in schema order. Raises ValueError for an unknown replication
+    mode or an IDL index on a column that is not monitored.
+    '''
+    tables = []
+    for table_name, table in schema['tables'].items():
+        columns = []
+        for column_name, coldef in table['columns'].items():
+            mode = coldef.get('replication', MONITORED)
+            if mode not in REPLICATION_MODES:
+                raise ValueError('%s.%s: unknown replication mode "%s"'
+                                 % (table_name, column_name, mode))
+            columns.append((column_name, mode))
+        modes = dict(columns)
+        indexes = extschema.idl_indexes(table)
+        for name, index_columns in indexes:
+            for column_name in index_columns:
+                if modes.get(column_name) not in (MONITORED,
+                                                  EPHEMERAL_STREAM):
+                    raise ValueError('%s: index %s needs monitored column '
+                                     '"%s"' % (table_name, name, column_name))
+        tables.append((table_name, columns, indexes))
+    return tables
+
+
+def c_header(tables, prefix, source):
+    guard = '%s_REPLICATION_H' % prefix.upper()
+    upper = prefix.upper()
+    out = ['/* %s */' % (BANNER % source), '',
+           '#ifndef %s' % guard, '#define %s 1' % guard, '',
+           '#include <stddef.h>',
+           '#include "ovsdb-idl.h"', '']
+    out += ['enum %s_replication_mode {' % prefix]
+    out += ['    %s_REPLICATION_%s,' % (upper, mode.upper())
+            for mode in REPLICATION_MODES]
+    out += ['};', '',
+            'struct %s_replication {' % prefix,
+            '    const struct ovsdb_idl_column *column;',
+            '    enum %s_replication_mode mode;' % prefix,
+            '};', '',
+            'struct %s_replication_index {' % prefix,
+            '    const char *name;',
+            '    const struct ovsdb_idl_column *const *columns;',
+            '    size_t n_columns;',
+            '};', '',
+            'struct %s_replication_table {' % prefix,
+            '    const struct ovsdb_idl_table_class *table;',
+            '    const struct %s_replication *columns;' % prefix,
+            '    size_t n_columns;',
+            '    const struct %s_replication_index *indexes;' % prefix,
+            '    size_t n_indexes;',
+            '};', '',
+            'extern const struct %s_replication_table '
+            '%s_replication_tables[];' % (prefix, prefix),
+            'extern const size_t %s_n_replication_tables;' % prefix, '',
+            '/* Adds \'table\' and all its columns to \'idl\', each with the '
+            'mode of its',
+            ' * "replication" annotation, and creates the indexes listed in '
+            'its',
+            ' * "idl_indexes". */',
+            'void %s_replication_register(struct ovsdb_idl *,' % prefix,
+            '%sconst struct ovsdb_idl_table_class *);'
+            % (' ' * len('void %s_replication_register(' % prefix)), '',
+            '#endif /* %s */' % guard]
+    return '\n'.join(out) + '\n'
+
+
+def c_source(tables, prefix, source, header, idl_header):
+    upper = prefix.upper()
+    out = ['/* %s */' % (BANNER % source), '',
+           '#include <config.h>', '',
+           '#include "%s"' % header,
+           '#include "%s"' % idl_header, '',
+           '#include "util.h"', '']
+    for table, columns, indexes in tables:
+        lower = table.lower()
+        out.append('static const struct %s_replication %s_%s_replication[] = {'
+                   % (prefix, prefix, lower))
+        for column, mode in columns:
+            out.append('    { &%s_%s_col_%s, %s_REPLICATION_%s },'
+                       % (prefix, lower, column, upper, mode.upper()))
+        out += ['};', '']
+        if not indexes:
+            continue
+        for name, index_columns in indexes:
+            out.append('static const struct ovsdb_idl_column *const '
+                       '%s_%s_%s_columns[] = {' % (prefix, lower, name))
+            out += ['    &%s_%s_col_%s,' % (prefix, lower, column)
+                    for column in index_columns]
+            out += ['};', '']
+        out.append('static const struct %s_replication_index '
+                   '%s_%s_indexes[] = {' % (prefix, prefix, lower))
+        for name, index_columns in indexes:
+            out += ['    { "%s", %s_%s_%s_columns,'
+                    % (name, prefix, lower, name),
+                    '      ARRAY_SIZE(%s_%s_%s_columns) },'
+                    % (prefix, lower, name)]
+        out += ['};', '']
+
+    out.append('const struct %s_replication_table %s_replication_tables[] = {'
+               % (prefix, prefix))
+    for table, columns, indexes in tables:
+        lower = table.lower()
+        out += ['    { &%s_table_%s, %s_%s_replication,'
+                % (prefix, lower, prefix, lower),
+                '      ARRAY_SIZE(%s_%s_replication),' % (prefix, lower)]
+        if indexes:
+            out.append('      %s_%s_indexes, ARRAY_SIZE(%s_%s_indexes) },'
+                       % (prefix, lower, prefix, lower))
+        else:
+            out.append('      NULL, 0 },')
+    out += ['};', '',
+            'const size_t %s_n_replication_tables = '
+            'ARRAY_SIZE(%s_replication_tables);' % (prefix, prefix), '',
+            'void',
+            '%s_replication_register(struct ovsdb_idl *idl,' % prefix,
+            '%sconst struct ovsdb_idl_table_class *table)'
+            % (' ' * len('%s_replication_register(' % prefix)),
+            '{',
+            '    size_t i, j;',
+            '',
+            '    for (i = 0; i < %s_n_replication_tables; i++) {' % prefix,
+            '        const struct %s_replication_table *rt =' % prefix,
+            '            &%s_replication_tables[i];' % prefix,
+            '',
+            '        if (rt->table != table) {',
+            '            continue;',
+            '        }',
+            '        ovsdb_idl_add_table(idl, table);',
+            '        for (j = 0; j < rt->n_columns; j++) {',
+            '            const struct %s_replication *r = &rt->columns[j];'
+            % prefix,
+            '',
+            '            switch (r->mode) {',
+            '            case %s_REPLICATION_MONITORED:' % upper,
+            '                ovsdb_idl_add_column(idl, r->column);',
+            '                break;',
+            '            case %s_REPLICATION_ON_DEMAND:' % upper,
+            '                ovsdb_idl_add_on_demand_column(idl, r->column);',
+            '                break;',
+            '            case %s_REPLICATION_EPHEMERAL_STREAM:' % upper,
+            '                ovsdb_idl_add_column(idl, r->column);',
+            '                ovsdb_idl_omit_alert(idl, r->column);',
+            '                break;',
+            '            }',
+            '        }',
+            '        for (j = 0; j < rt->n_indexes; j++) {',
+            '            const struct %s_replication_index *ri = '
+            '&rt->indexes[j];' % prefix,
+            '            struct ovsdb_idl_index *index;',
+            '            size_t k;',
+            '',
+            '            index = ovsdb_idl_create_index(idl, table, '
+            'ri->name);',
+            '            for (k = 0; k < ri->n_columns; k++) {',
+            '                ovsdb_idl_index_add_column(index, '
+            'ri->columns[k],',
+            '                                           '
+            'OVSDB_INDEX_ASC, NULL);',
+            '            }',
+            '        }',
+            '        return;',
+            '    }',
+            '}']
+    return '\n'.join(out) + '\n'
+
+
+def python_module(tables, source):
+    out = ['# %s' % (BANNER % source), '',
+           'MONITORED = %r' % MONITORED,
+           'ON_DEMAND = %r' % ON_DEMAND,
+           'EPHEMERAL_STREAM = %r' % EPHEMERAL_STREAM, '',
+           '# Replication mode of every column, per table.',
+           'REPLICATION = {']
+    for table, columns, indexes in tables:
+        out.append('    %r: {' % str(table))
+        for column, mode in columns:
+            out.append('        %r: %s,' % (str(column), mode.upper()))
+        out.append('    },')
+    out += ['}', '',
+            '# Non-unique indexes of the replica, by table and index name.',
+            'IDL_INDEXES = {']
+    for table, columns, indexes in tables:
+        if indexes:
+            out.append('    %r: {' % str(table))
+            for name, index_columns in indexes:
+                out.append('        %r: (%s),' % (str(name), ''.join(
+                    '%r, ' % str(c) for c in index_columns).rstrip()))
+            out.append('    },')
+    out += ['}', '', '',
+            'def columns(table, modes=(MONITORED, EPHEMERAL_STREAM)):',
+            '    return sorted(c for c, m in REPLICATION[table].items()',
+            '                  if m in modes)', '', '',
+            'def register(schema_helper, table,',
+            '             modes=(MONITORED, EPHEMERAL_STREAM)):',
+            "    '''",
+            '    Registers the columns of table whose replication mode is in',
+            '    modes with an ovs.db.idl.SchemaHelper. On-demand columns are',
+            '    left out by default: read them with an explicit select.',
+            "    '''",
+            '    registered = columns(table, modes)',
+            '    schema_helper.register_columns(table, registered)',
+            '    return registered']
+    return '\n'.join(out) + '\n'
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Generate IDL registration tables from the '
+                    '"replication" schema annotations.')
+    parser.add_argument('--format', required=True,
+                        choices=('c-header', 'c-source', 'python'))
+    parser.add_argument('--prefix', default='ovsrec',
+                        help='C IDL prefix (default: ovsrec)')
+    parser.add_argument('--header',
+                        help='name of the generated header, for c-source '
+                             '(default: output with a .h extension)')
+    parser.add_argument('--idl-header', default='vswitch-idl.h',
+                        help='header of the generated C IDL, for c-source '
+                             '(default: vswitch-idl.h)')
+    parser.add_argument('input_schema')
+    parser.add_argument('output')
+    return parser.parse_args(argv)
+
+
+#
+# main
+#
+def main(argv):
+    args = parse_args(argv)
+    try:
+        tables = column_modes(extschema.load(args.input_schema))
+    except ValueError as e:
+        print('replication.py: %s' % e)
+        return 1
+
+    source = os.path.basename(args.input_schema)
+    if args.format == 'c-header':
+        text = c_header(tables, args.prefix, source)
+    elif args.format == 'c-source':
+        header = args.header or \
+            os.path.basename(os.path.splitext(args.output)[0]) + '.h'
+        text = c_source(tables, args.prefix, source, header, args.idl_header)
+    else:
+        text = python_module(tables, source)
+
+    with open(args.output, 'w') as fp:
+        fp.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+'''
+Generates the REST API documentation of an extended schema as one JSON
+file per resource, regenerating only the resources that changed.
+
+Usage:
+    restdocs.py [--force] input-schema input-xml output-dir
+
+Every table with at least one categorized column or "relationship"
+link is a resource. Its documentation (description, columns grouped by
+category with their documented keys, parent, child and reference links,
+and its URL paths) is written to output-dir/resources/<table>.json.
+
+URL paths are built as restd builds them. A "1:m" column adds its name
+under the path of its table, and an "m:1" (parent) column adds the
+plural of its table under the path of the parent. Resources that no
+such link reaches are top-level resources, at /system/<plural>, such as
+/system/ports and /system/interfaces.
+
+output-dir/index.json lists the resources with their file, paths and
+digest, so that the rendering module can load the index first and then
+fetch resources one at a time instead of parsing a single document.
+The digest covers the table definition, its XML documentation and the
+chain of "relationship" links that leads to it, so a resource is only
+rewritten when one of these changed. The index also serves as the
+cache: --force regenerates every resource.
+'''
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict
+
+import extschema
+
+INDEX_NAME = 'index.json'
+RESOURCES_DIR = 'resources'
+ROOT = 'System'
+ROOT_PATH = '/system'
+
+CATEGORIES = ('configuration', 'status', 'statistics', 'per-value')
+CHILD = '1:m'
+PARENT = 'm:1'
+REFERENCE = 'reference'
+
+
+def _digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _tool_digest():
+    # Changes to this script invalidate every resource.
+    with open(os.path.abspath(__file__).replace('.pyc', '.py'), 'rb') as fp:
+        return _digest(fp.read())
+
+
+def _ref(element):
+    # <ref table="T" column="c" key="k"/> reads as T:c:k.
+    return ':'.join(element.get(a) for a in ('table', 'column', 'key', 'group')
+                    if element.get(a))
+
+
+def _itertext(element):
+    if element.tag == 'ref':
+        yield _ref(element)
+    elif element.text:
+        yield element.text
+    for child in element:
+        for text in _itertext(child):
+            yield text
+        if child.tail:
+            yield child.tail
+
+
+def _text(element):
+    return ' '.join(''.join(_itertext(element)).split()) \
+        if element is not None else ''
+
+
+def _description(element):
+    '''
+    Returns the text of element that precedes its first <group> or
+    <column>, i.e. the description of the table itself.
+    '''
+    if element is None:
+        return ''
+    parts = [element.text or '']
+    for child in element:
+        if child.tag in ('group', 'column'):
+            break
+        parts.extend(_itertext(child))
+        parts.append(child.tail or '')
+    return ' '.join(''.join(parts).split())
+
+
+def load_docs(xml_path):
+    '''
+    Returns {table: element} for the <table> elements of the schema XML.
+    '''
+    root = ElementTree.parse(xml_path).getroot()
+    return dict((table.get('name'), table) for table in root.iter('table'))
+
+
+def links(tabledef, relationship):
+    '''
+    Returns [(column, table), ...] for the columns of tabledef with the
+    given "relationship".
+    '''
+    result = []
+    for column, coldef in tabledef['columns'].items():
+        if coldef.get('relationship') == relationship:
+            result.append((column,
+                           extschema.column_type(coldef).ref_table()))
+    return result
+
+
+def plural(table):
+    '''
+    Returns the URL segment of a collection of table rows: the table name
+    in lower case, in the plural (Port: ports, Route_Map_Entry:
+    route_map_entries, Interface_Statistics: interface_statistics).
+    '''
+    name = table.lower()
+    if name.endswith('s'):
+        return name
+    if name.endswith(('x', 'ch', 'sh')):
+        return name + 'es'
+    if name.endswith('y') and name[-2:-1] not in 'aeiou':
+        return name[:-1] + 'ies'
+    return name + 's'
+
+
+def resource_paths(schema):
+    '''
+    Returns {table: [path, ...]} for System, the tables reached from it
+    through "1:m" and "m:1" links, and the top-level resources with the
+    tables they reach. Every row along the way but System is identified
+    by an {id} segment.
+    '''
+    tables = schema['tables']
+    children = {}
+    for table, tabledef in tables.items():
+        for column, child in links(tabledef, CHILD):
+            children.setdefault(table, []).append((column, child))
+        for column, parent in links(tabledef, PARENT):
+            children.setdefault(parent, []).append((plural(table), table))
+    reached = set(child for table_children in children.values()
+                  for _, child in table_children)
+
+    paths = {}
+
+    def walk(tops):
+        queue = []
+        for table, path in tops:
+            paths.setdefault(table, []).append(path)
+            queue.append((table, path if table == ROOT else path + '/{id}',
+                          (table,)))
+        while queue:
+            table, path, seen = queue.pop(0)
+            for segment, child in children.get(table, []):
+                if child in seen:
+                    continue
+                child_path = '%s/%s' % (path, segment)
+                paths.setdefault(child, []).append(child_path)
+                queue.append((child, child_path + '/{id}', seen + (child,)))
+
+    def top_level(tables_):
+        return [(table, '%s/%s' % (ROOT_PATH, plural(table)))
+                for table in tables_]
+
+    resources = [table for table, tabledef in tables.items()
+                 if table != ROOT and is_resource(tabledef)]
+    walk([(ROOT, ROOT_PATH)] +
+         top_level(t for t in resources if t not in reached))
+    # Tables whose parents are only reachable through themselves.
+    walk(top_level(t for t in resources if t not in paths))
+    return paths
+
+
+def is_resource(tabledef):
+    for coldef in tabledef['columns'].values():
+        if coldef.get('category') is not None or \
+                coldef.get('relationship') is not None:
+            return True
+    return False
+
+
+def resource_digest(tool, table, tabledef, element, paths):
+    '''
+    Returns the digest of everything the documentation of table depends
+    on.
+    '''
+    data = json.dumps([tool, table, tabledef, paths],
+                      separators=(',', ':')).encode('utf-8')
+    if element is not None:
+        data += ElementTree.tostring(element)
+    return _digest(data)
+
+
+def _column_docs(element):
+    '''
+    Returns ({column: doc}, {column: {key: {'type', 'doc'}}}) from the
+    <column> elements of a <table> element.
+    '''
+    docs, keys = {}, {}
+    if element is None:
+        return docs, keys
+    for column in element.iter('column'):
+        name, key = column.get('name'), column.get('key')
+        if key is None:
+            docs[name] = _text(column)
+        else:
+            keytype = column.get('type')
+            keys.setdefault(name, OrderedDict())[key] = OrderedDict([
+                ('type', json.loads(keytype) if keytype else None),
+                ('doc', _text(column)),
+            ])
+    return docs, keys
+
+
+def document(table, tabledef, element, paths):
+    '''
+    Returns the documentation of the resource for table.
+    '''
+    docs, keys = _column_docs(element)
+    doc = OrderedDict([
+        ('resource', table),
+        ('title', element.get('title', '') if element is not None else ''),
+        ('description', _description(element)),
+        ('paths', paths),
+        ('indexes', tabledef.get('indexes', [])),
+    ])
+    for category in CATEGORIES:
+        doc[category] = OrderedDict()
+    for column, coldef in tabledef['columns'].items():
+        category = extschema.resolve_category(tabledef, column)
+        if category is None:
+            continue
+        entry = OrderedDict([('type', coldef['type']),
+                             ('doc', docs.get(column, ''))])
+        if coldef.get('mutable', True) is False:
+            entry['mutable'] = False
+        if column in keys:
+            entry['keys'] = keys[column]
+        if category == 'per-value':
+            entry['categories'] = extschema.column_category(coldef)[1]
+        doc[category][column] = entry
+    for name, relationship in (('children', CHILD), ('parents', PARENT),
+                               ('references', REFERENCE)):
+        doc[name] = OrderedDict(links(tabledef, relationship))
+    return doc
+
+
+def load_index(path, tool):
+    '''
+    Returns {table: digest} from a previous index.json written by the
+    same version of this script, or {}.
+    '''
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as fp:
+            index = json.load(fp)
+    except ValueError:
+        return {}
+    if index.get('tool') != tool:
+        return {}
+    return dict((r['resource'], r['digest']) for r in index['resources'])
+
+
+def generate(schema, docs, output_dir, force=False):
+    '''
+    Writes the documentation of every resource of schema into output_dir
+    and returns (regenerated, unchanged, removed) lists of tables.
+    '''
+    tool = _tool_digest()
+    index_path = os.path.join(output_dir, INDEX_NAME)
+    resources_dir = os.path.join(output_dir, RESOURCES_DIR)
+    if not os.path.isdir(resources_dir):
+        os.makedirs(resources_dir)
+    previous = {} if force else load_index(index_path, tool)
+
+    all_paths = resource_paths(schema)
+    index = OrderedDict([('tool', tool), ('resources', [])])
+    regenerated, unchanged = [], []
+    for table, tabledef in schema['tables'].items():
+        if not is_resource(tabledef):
+            continue
+        element = docs.get(table)
+        paths = all_paths.get(table, [])
+        digest = resource_digest(tool, table, tabledef, element, paths)
+        filename = '%s/%s.json' % (RESOURCES_DIR, table)
+        path = os.path.join(output_dir, filename)
+
+        if previous.get(table) == digest and os.path.exists(path):
+            unchanged.append(table)
+        else:
+            text = json.dumps(document(table, tabledef, element, paths),
+                              indent=2, separators=(',', ': ')) + '\n'
+            with open(path, 'w') as fp:
+                fp.write(text)
+            regenerated.append(table)
+
+        index['resources'].append(OrderedDict([
+            ('resource', table),
+            ('file', filename),
+            ('paths', paths),
+            ('digest', digest),
+        ]))
+
+    tables = set(r['resource'] for r in index['resources'])
+    removed = []
+    for filename in sorted(os.listdir(resources_dir)):
+        table, ext = os.path.splitext(filename)
+        if ext == '.json' and table not in tables:
+            os.remove(os.path.join(resources_dir, filename))
+            removed.append(table)
+
+    tmp = index_path + '.tmp'
+    with open(tmp, 'w') as fp:
+        fp.write(json.dumps(index, indent=2, separators=(',', ': ')) + '\n')
+    os.rename(tmp, index_path)
+    return regenerated, unchanged, removed
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Generate per-resource REST API documentation.')
+    parser.add_argument('--force', action='store_true',
+                        help='regenerate every resource')
+    parser.add_argument('input_schema')
+    parser.add_argument('input_xml')
+    parser.add_argument('output_dir')
+    return parser.parse_args(argv)
+
+
+#
+# main
+#
+def main(argv):
+    args = parse_args(argv)
+    regenerated, unchanged, removed = generate(
+        extschema.load(args.input_schema), load_docs(args.input_xml),
+        args.output_dir, args.force)
+    print('%s: %d resources regenerated, %d up to date, %d removed'
+          % (args.output_dir, len(regenerated), len(unchanged),
+             len(removed)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+'''
+Reference route-map evaluator with a memoized evaluation layer, and a
+benchmark of a soft-clear with and without the cache.
+
+Usage:
+    routemap.py [--routes N] [--attribute-sets N] [--entries N] [--seed S]
+
+A route-map is {'version': cfg_version, 'entries': {preference: entry}},
+where entry holds the Route_Map_Entry columns action, match, set and
+exitpolicy, with goto_target given as the preference of the target
+entry and call as the name of the called route-map. Entries are
+evaluated in preference order, as in the CLI: the first entry whose
+match rules all hold decides; a deny entry denies the route, a permit
+entry applies its set rules, calls its route-map if any, and then
+stops, or continues with the next entry ("next") or with goto_target
+("goto"). A route that matches no entry is denied, and so is a route
+whose evaluation calls a route-map that does not exist or one that is
+already being evaluated (a cycle such as a -> b -> a).
+
+The result of a route-map only depends on the interned path attributes
+of the route (BGP_Path_Attributes), the verdicts of the prefix lists
+that the route-map matches on, and the few per-route values that its
+match rules read (the MED for "metric", the next hop for "ipv6
+next-hop"). RouteMapCache memoizes results under the key
+
+    (route-map versions, attribute set, prefix-list verdicts, values)
+
+so that routes sharing attributes, such as the routes re-evaluated after
+a soft clear, are evaluated once. The versions are the cfg_version of
+the route-map and of the route-maps it calls: a change to any of them
+drops the results of the route-map. Route-maps with "probability"
+rules are not deterministic and are never cached.
+
+The benchmark evaluates a synthetic BGP table of --routes routes with
+--attribute-sets distinct attribute sets, twice (the second pass being
+a soft clear), and checks that the cached results are those of the
+evaluator.
+'''
+
+import sys
+import time
+import random
+import argparse
+
+import prefixlist
+
+PERMIT = 'permit'
+DENY = 'deny'
+NEXT = 'next'
+GOTO = 'goto'
+
+PREFIX_LIST_MATCHES = ('ip address prefix-list', 'ipv6 address prefix-list')
+# Match rules on per-route values, and the Route field they read.
+VALUE_MATCHES = {'metric': 'metric', 'ipv6 next-hop': 'nexthop'}
+ATTRIBUTE_MATCHES = {'origin': 'bgp_origin'}
+PROBABILITY = 'probability'
+
+ATTRIBUTE_SETS = {'local-preference': 'bgp_loc_pref', 'origin': 'bgp_origin'}
+PREPEND = 'as-path prepend'
+METRIC = 'metric'
+
+
+class Route(object):
+    '''
+    The inputs of a route-map: the route prefix, its interned path
+    attributes (a dict, identified by attributes_key) and its per-route
+    values.
+    '''
+
+    __slots__ = ('family', 'address', 'length', 'attributes_key',
+                 'attributes', 'metric', 'nexthop')
+
+    def __init__(self, prefix, attributes_key, attributes, metric=0,
+                 nexthop=None):
+        self.family, self.address, self.length = prefix
+        self.attributes_key = attributes_key
+        self.attributes = attributes
+        self.metric = metric
+        self.nexthop = nexthop
+
+
+class RouteMap(object):
+    '''
+    A compiled route-map: its entries in preference order, and the
+    inputs its result depends on.
+    '''
+
+    def __init__(self, name, route_map):
+        self.name = name
+        self.version = route_map['version']
+        self.preferences = sorted(route_map['entries'])
+        self.entries = [route_map['entries'][p] for p in self.preferences]
+        self.prefix_lists = []
+        self.values = []
+        self.calls = []
+        self.cacheable = True
+        for entry in self.entries:
+            for rule, value in entry.get('match', {}).items():
+                if rule in PREFIX_LIST_MATCHES:
+                    if value not in self.prefix_lists:
+                        self.prefix_lists.append(value)
+                elif rule in VALUE_MATCHES:
+                    if VALUE_MATCHES[rule] not in self.values:
+                        self.values.append(VALUE_MATCHES[rule])
+                elif rule == PROBABILITY:
+                    self.cacheable = False
+                elif rule not in ATTRIBUTE_MATCHES:
+                    raise ValueError('%s: unsupported match rule "%s"'
+                                     % (name, rule))
+            for rule in entry.get('set', {}):
+                if rule not in ATTRIBUTE_SETS and rule not in (PREPEND,
+                                                               METRIC):
+                    raise ValueError('%s: unsupported set rule "%s"'
+                                     % (name, rule))
+            if entry.get('call') and entry['call'] not in self.calls:
+                self.calls.append(entry['call'])
+
+
+def _matches(entry, route, verdicts, rng):
+    for rule, value in entry.get('match', {}).items():
+        if rule in PREFIX_LIST_MATCHES:
+            if not verdicts[value]:
+                return False
+        elif rule in VALUE_MATCHES:
+            if str(getattr(route, VALUE_MATCHES[rule])) != value:
+                return False
+        elif rule in ATTRIBUTE_MATCHES:
+            if route.attributes.get(ATTRIBUTE_MATCHES[rule]) != value:
+                return False
+        elif rule == PROBABILITY:
+            if rng.random() * 100 >= int(value):
+                return False
+    return True
+
+
+def _apply(entry, attributes, metric):
+    # Applies the set rules of entry to attributes and returns the
+    # metric change: None (unchanged) or (op, value), op being '=', '+'
+    # or '-'.
+    for rule, value in entry.get('set', {}).items():
+        if rule in ATTRIBUTE_SETS:
+            attributes[ATTRIBUTE_SETS[rule]] = value
+        elif rule == PREPEND:
+            path = attributes.get('bgp_as_path')
+            attributes['bgp_as_path'] = ','.join(value.split()) + \
+                (',' + path if path else '')
+        elif rule == METRIC:
+            op = value[0] if value[0] in '+-' else '='
+            metric = (op, int(value.lstrip('+-')))
+    return metric
+
+
+def evaluate(maps, name, route, verdicts, rng=random, chain=()):
+    '''
+    Evaluates route-map name of maps, {name: RouteMap}, on route, with
+    verdicts, {prefix list name: permitted}. Returns (action, attributes,
+    metric): attributes is the dict of path attributes after the set
+    rules, or None when they are unchanged, and metric is None or
+    (op, value) to apply to the MED of the route. chain holds the names
+    of the route-maps being evaluated, which name calls into.
+    '''
+    route_map = maps.get(name)
+    if route_map is None or name in chain:
+        return DENY, None, None
+    attributes = dict(route.attributes)
+    metric = None
+    permitted = False
+    i = 0
+    while i < len(route_map.entries):
+        entry = route_map.entries[i]
+        if not _matches(entry, route, verdicts, rng):
+            i += 1
+            continue
+        if entry['action'] == DENY:
+            return DENY, None, None
+        permitted = True
+        metric = _apply(entry, attributes, metric)
+        if entry.get('call'):
+            called = Route((route.family, route.address, route.length),
+                           None, attributes, route.metric, route.nexthop)
+            action, called_attributes, called_metric = evaluate(
+                maps, entry['call'], called, verdicts, rng, chain + (name,))
+            if action == DENY:
+                return DENY, None, None
+            attributes = called_attributes or attributes
+            metric = called_metric or metric
+        exitpolicy = entry.get('exitpolicy')
+        if exitpolicy == NEXT:
+            i += 1
+        elif exitpolicy == GOTO and \
+                entry.get('goto_target') in route_map.preferences[i + 1:]:
+            # Only forward jumps, so that evaluation always ends.
+            i = route_map.preferences.index(entry['goto_target'])
+        else:
+            break
+    if not permitted:
+        return DENY, None, None
+    changed = attributes if attributes != route.attributes else None
+    return PERMIT, changed, metric
+
+
+class RouteMapCache(object):
+    '''
+    Compiled route-maps and memoized results, by route-map name.
+    '''
+
+    def __init__(self, prefix_lists):
+        self.prefix_lists = prefix_lists
+        self.maps = {}
+        self.results = {}
+        self.plans = {}
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, name, route_map):
+        '''
+        Installs route_map, {'version', 'entries'}, under name. The results
+        of name are dropped if its version changed.
+        '''
+        current = self.maps.get(name)
+        if current is None or current.version != route_map['version']:
+            self.maps[name] = RouteMap(name, route_map)
+            self.results.pop(name, None)
+            self.plans = {}
+
+    def _versions(self, name, seen=()):
+        # A missing route-map has version None, so that installing it
+        # drops the results of the route-maps that call it.
+        route_map = self.maps.get(name)
+        if route_map is None:
+            return (name, None)
+        versions = (name, route_map.version)
+        for called in route_map.calls:
+            if called not in seen:
+                versions += self._versions(called, seen + (name,))
+        return versions
+
+    def _plan(self, name):
+        # Returns (versions, prefix lists, values, cacheable) for
+        # route-map name and the route-maps it calls.
+        plan = self.plans.get(name)
+        if plan is None:
+            versions = self._versions(name)
+            called = [self.maps[n] for n in versions[::2] if n in self.maps]
+            lists = sorted(set(n for m in called for n in m.prefix_lists))
+            values = tuple(v for m in called for v in m.values)
+            cacheable = all(m.cacheable for m in called)
+            plan = (versions, lists, values, cacheable)
+            self.plans[name] = plan
+        return plan
+
+    def verdicts(self, name, route):
+        '''
+        Returns {prefix list name: permitted} for the prefix lists that
+        route-map name and the route-maps it calls match on.
+        '''
+        verdicts = {}
+        for list_name in self._plan(name)[1]:
+            compiled = self.prefix_lists.get(list_name)
+            verdicts[list_name] = compiled is not None and compiled.permits(
+                route.family, route.address, route.length)
+        return verdicts
+
+    def evaluate(self, name, route):
+        '''
+        Returns the result of route-map name on route, as evaluate() does,
+        from the cache when possible. Results are shared by the routes
+        with the same key and must not be modified.
+        '''
+        versions, lists, values, cacheable = self._plan(name)
+        verdicts = self.verdicts(name, route)
+        if not cacheable:
+            return evaluate(self.maps, name, route, verdicts)
+        key = (route.attributes_key, tuple(verdicts[n] for n in lists),
+               tuple(getattr(route, value) for value in values))
+        cached = self.results.get(name)
+        if cached is None or cached[0] != versions:
+            cached = (versions, {})
+            self.results[name] = cached
+        result = cached[1].get(key)
+        if result is None:
+            self.misses += 1
+            result = evaluate(self.maps, name, route, verdicts)
+            cached[1][key] = result
+        else:
+            self.hits += 1
+        return result
+
+    def invalidate(self, name):
+        self.results.pop(name, None)
+
+
+def synthetic_attribute_sets(count, rng):
+    sets = []
+    for _ in range(count):
+        path = [str(rng.randint(1, 65000))
+                for _ in range(rng.randint(1, 6))]
+        sets.append({'bgp_as_path': ','.join(path),
+                     'bgp_origin': rng.choice(('IGP', 'IGP', 'EGP',
+                                               'incomplete')),
+                     'bgp_loc_pref': '100'})
+    return sets
+
+
+def synthetic_routes(count, attribute_sets, rng):
+    '''
+    Returns count routes. Attribute sets are drawn with a skewed
+    distribution: a few sets (the upstream transits) carry most routes.
+    '''
+    table = prefixlist.synthetic_table(count, rng)
+    routes = []
+    for prefix in table:
+        index = min(int(rng.paretovariate(1.2)) - 1,
+                    len(attribute_sets) - 1)
+        routes.append(Route(prefix, index, attribute_sets[index],
+                            metric=rng.choice((0, 0, 0, 10, 20))))
+    return routes
+
+
+def synthetic_route_map(entries, list_names, rng):
+    '''
+    Returns a route-map of entries entries matching on prefix lists,
+    origin and metric, with a final "permit" that sets local-preference.
+    '''
+    route_map = {}
+    for i in range(entries - 1):
+        entry = {'action': rng.choice((PERMIT, DENY)), 'match': {}, 'set': {}}
+        entry['match'][PREFIX_LIST_MATCHES[0]] = rng.choice(list_names)
+        if rng.random() < 0.3:
+            entry['match']['origin'] = rng.choice(('IGP', 'EGP'))
+        if rng.random() < 0.1:
+            entry['match']['metric'] = '10'
+        if entry['action'] == PERMIT:
+            entry['set']['local-preference'] = str(rng.randint(50, 300))
+            if rng.random() < 0.3:
+                entry['set'][PREPEND] = '65001 65001'
+            if rng.random() < 0.2:
+                entry['exitpolicy'] = NEXT
+        route_map[(i + 1) * 10] = entry
+    route_map[entries * 10] = {'action': PERMIT, 'match': {},
+                               'set': {'local-preference': '100'}}
+    return {'version': 1, 'entries': route_map}
+
+
+def _timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def benchmark(routes, route_map, prefix_lists):
+    '''
+    Returns a dict of timings, in seconds, cache statistics, and the
+    number of routes on which cached and uncached evaluation disagree.
+    '''
+    cache = RouteMapCache(prefix_lists)
+    cache.update('rm', route_map)
+
+    def uncached():
+        return [evaluate(cache.maps, 'rm', r, cache.verdicts('rm', r))
+                for r in routes]
+
+    uncached_time, expected = _timed(uncached)
+    first_time, first = _timed(lambda: [cache.evaluate('rm', r)
+                                        for r in routes])
+    soft_time, soft = _timed(lambda: [cache.evaluate('rm', r)
+                                      for r in routes])
+    return {
+        'routes': len(routes),
+        'results': len(cache.results['rm'][1]),
+        'uncached': uncached_time,
+        'first': first_time,
+        'soft_clear': soft_time,
+        'hit_ratio': float(cache.hits) / max(cache.hits + cache.misses, 1),
+        'mismatches': sum(1 for a, b, c in zip(expected, first, soft)
+                          if not a == b == c),
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the route-map evaluation cache.')
+    parser.add_argument('--routes', type=int, default=200000,
+                        help='routes of the synthetic table '
+                        '(default: 200000)')
+    parser.add_argument('--attribute-sets', type=int, default=5000,
+                        help='distinct path attribute sets (default: 5000)')
+    parser.add_argument('--entries', type=int, default=20,
+                        help='entries of the route-map (default: 20)')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+#
+# main
+#
+def main(argv):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    attribute_sets = synthetic_attribute_sets(args.attribute_sets, rng)
+    routes = synthetic_routes(args.routes, attribute_sets, rng)
+
+    table = [(r.family, r.address, r.length) for r in routes]
+    lists = prefixlist.PrefixListCache()
+    prefix_lists = {}
+    for i in range(4):
+        name = 'pl%d' % i
+        entries = prefixlist.synthetic_list(1000, table, rng)
+        prefix_lists[name] = lists.get(name, 1, lambda: entries)
+    route_map = synthetic_route_map(args.entries, sorted(prefix_lists), rng)
+
+    result = benchmark(routes, route_map, prefix_lists)
+    print('%d routes, %d distinct results'
+          % (result['routes'], result['results']))
+    print('uncached %.3f s, first pass %.3f s, soft clear %.3f s '
+          '(hit ratio %.1f%%)' % (result['uncached'], result['first'],
+                                  result['soft_clear'],
+                                  result['hit_ratio'] * 100))
+    if result['mismatches']:
+        print('%d routes evaluated differently' % result['mismatches'])
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+'''
+Generates typed Python row classes from an extended schema and its XML
+documentation.
+
+Usage:
+    rowclasses.py input-schema input-xml output
+
+Every table becomes a class with __slots__ (one slot per column, plus
+'uuid'), so that a replica of a large table (Route, MAC, ...) does not
+carry a dict per row. Columns named after a Python keyword get a
+trailing underscore ('from' becomes 'from_').
+
+Every map key documented in the XML gets a read-only property named
+<column>_<key> that parses the value with the type documented for the
+key, e.g. System.other_config_stats_update_interval returns an int (or
+None when the key is not set).
+
+Every entry of the table's 'indexes' gets a classmethod
+index_by_<columns>() returning an Index, a dict from the indexed
+columns to the row. Every entry of its 'idl_indexes' gets one returning
+a MultiIndex, a dict from the indexed columns to the list of rows.
+'''
+
+import re
+import sys
+import keyword
+
+import extschema
+
+RESERVED = set(keyword.kwlist) | set(['print', 'exec', 'nonlocal', 'True',
+                                      'False', 'None', 'async', 'await'])
+
+HEADER = """\
+# Generated from %(schema)s and %(xml)s by schema/rowclasses.py.
+# Do not edit.
+
+from operator import attrgetter as _attrgetter
+
+
+def _integer(value):
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _real(value):
+    if value is None or isinstance(value, float):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _boolean(value):
+    if value is None or isinstance(value, bool):
+        return value
+    return {'true': True, 'false': False}.get(value)
+
+
+def _string(value):
+    return value
+
+
+def _frozen(value):
+    # Map and set columns can be indexed too: make them hashable.
+    if isinstance(value, dict):
+        return frozenset(value.items())
+    if isinstance(value, (list, set)):
+        return frozenset(value)
+    return value
+
+
+class Index(object):
+    '''
+    Maps the values of the indexed columns of a table to its row.
+    '''
+
+    __slots__ = ('columns', 'getter', 'rows')
+
+    def __init__(self, columns, rows=()):
+        self.columns = columns
+        self.getter = _attrgetter(*columns)
+        self.rows = {}
+        for row in rows:
+            self.add(row)
+
+    def _key(self, values):
+        if len(self.columns) == 1:
+            return _frozen(values)
+        return tuple(_frozen(value) for value in values)
+
+    def key(self, row):
+        return self._key(self.getter(row))
+
+    def add(self, row):
+        self.rows[self.key(row)] = row
+
+    def remove(self, row):
+        self.rows.pop(self.key(row), None)
+
+    def get(self, *key):
+        return self.rows.get(self._key(key[0] if len(key) == 1 else key))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return self._key(key) in self.rows
+
+
+class MultiIndex(Index):
+    '''
+    Maps the values of the indexed columns of a table to the list of its
+    rows with these values.
+    '''
+
+    __slots__ = ()
+
+    def add(self, row):
+        self.rows.setdefault(self.key(row), []).append(row)
+
+    def remove(self, row):
+        key = self.key(row)
+        rows = self.rows.get(key, [])
+        if row in rows:
+            rows.remove(row)
+            if not rows:
+                del self.rows[key]
+
+    def get(self, *key):
+        return Index.get(self, *key) or []
+
+
+class Row(object):
+    '''
+    Base class of the generated row classes.
+    '''
+
+    __slots__ = ('uuid',)
+
+    TABLE = None
+    COLUMNS = ()
+    ATTRIBUTES = ()
+    DEFAULTS = ()
+    INDEXES = ()
+    IDL_INDEXES = ()
+
+    def __init__(self, uuid=None, **columns):
+        self.uuid = uuid
+        for attribute, default in zip(self.ATTRIBUTES, self.DEFAULTS):
+            if attribute in columns:
+                setattr(self, attribute, columns[attribute])
+            else:
+                setattr(self, attribute,
+                        default() if callable(default) else default)
+
+    @classmethod
+    def from_idl(cls, idl_row):
+        \'\'\'
+        Copies the registered columns of an ovs.db.idl.Row.
+        \'\'\'
+        row = cls(idl_row.uuid)
+        for column, attribute in zip(cls.COLUMNS, cls.ATTRIBUTES):
+            try:
+                setattr(row, attribute, getattr(idl_row, column))
+            except AttributeError:
+                pass
+        return row
+
+    def __repr__(self):
+        return '%%s(%%s)' %% (self.__class__.__name__, self.uuid)
+"""
+
+
+def attribute_name(name):
+    return name + '_' if name in RESERVED else name
+
+
+def key_attribute(column, key, taken):
+    name = re.sub(r'\W', '_', '%s_%s' % (column, key)).lower()
+    if name[0].isdigit():
+        name = '_' + name
+    base, i = name, 2
+    while name in taken:
+        name = '%s_%d' % (base, i)
+        i += 1
+    taken.add(name)
+    return name
+
+
+def default_value(coltype):
+    if coltype.is_map():
+        return 'dict'
+    if not coltype.is_scalar():
+        return 'list'
+    return {
+        'integer': '0',
+        'real': '0.0',
+        'boolean': 'False',
+        'string': "''",
+        'uuid': 'None',
+    }[coltype.key['type']]
+
+
+def first_sentence(doc):
+    sentence = doc.split('. ')[0].rstrip('.') + '.'
+    if len(sentence) > 62:
+        sentence = sentence[:59].rsplit(' ', 1)[0] + '...'
+    return sentence.replace('\\', '\\\\').replace("'", "\\'")
+
+
+def _tuple(prefix, items):
+    '''
+    Formats prefix followed by a tuple of items (already literals),
+    wrapped at 79 columns.
+    '''
+    if len(items) == 1:
+        return [prefix + '(%s,)' % items[0]]
+    lines = [prefix + '(']
+    indent = ' ' * len(lines[0])
+    for i, item in enumerate(items):
+        item += ',' if i < len(items) - 1 else ')'
+        if len(lines[-1]) + len(item) + 1 > 79 and lines[-1].strip() != '(' \
+                and not lines[-1].endswith('('):
+            lines.append(indent + item)
+        elif lines[-1].endswith('('):
+            lines[-1] += item
+        else:
+            lines[-1] += ' ' + item
+    if not items:
+        lines[-1] += ')'
+    return lines
+
+
+def generate_class(table_name, table, keys):
+    columns = list(table['columns'])
+    attributes = [attribute_name(c) for c in columns]
+    defaults = [default_value(extschema.column_type(table['columns'][c]))
+                for c in columns]
+    indexes = [[attribute_name(c) for c in index]
+               for index in table.get('indexes', [])]
+    idl_indexes = [[attribute_name(c) for c in index]
+                   for _, index in extschema.idl_indexes(table)
+                   if list(index) not in table.get('indexes', [])]
+
+    out = ['', '', 'class %s(Row):' % table_name]
+    out += _tuple('    __slots__ = ', ["'%s'" % a for a in attributes])
+    out.append('')
+    out.append("    TABLE = '%s'" % table_name)
+    out += _tuple('    COLUMNS = ', ["'%s'" % c for c in columns])
+    out.append('    ATTRIBUTES = __slots__')
+    out += _tuple('    DEFAULTS = ', defaults)
+    out += _tuple('    INDEXES = ', [_tuple('', ["'%s'" % c for c in index])[0]
+                                     for index in indexes])
+    if idl_indexes:
+        out += _tuple('    IDL_INDEXES = ',
+                      [_tuple('', ["'%s'" % c for c in index])[0]
+                       for index in idl_indexes])
+
+    for cls, class_indexes in (('Index', indexes),
+                               ('MultiIndex', idl_indexes)):
+        for index in class_indexes:
+            out += ['',
+                    '    @classmethod',
+                    '    def index_by_%s(cls, rows=()):' % '_'.join(
+                        c.rstrip('_') for c in index)]
+            out += _tuple('        return %s(' % cls,
+                          ["'%s'" % c for c in index])
+            out[-1] += ', rows)'
+
+    taken = set(attributes)
+    for column, column_keys in keys.items():
+        if column not in table['columns']:
+            continue
+        coltype = extschema.column_type(table['columns'][column])
+        if not coltype.is_map():
+            continue
+        attribute = attribute_name(column)
+        for key, info in column_keys.items():
+            keytype = extschema.base_type(info['type']) or coltype.value
+            parser = '_%s' % keytype['type'] \
+                if keytype['type'] != 'uuid' else ''
+            if coltype.key['type'] == 'integer':
+                try:
+                    lookup = '%d' % int(key)
+                except ValueError:
+                    continue
+            else:
+                lookup = "'%s'" % key
+            out += ['',
+                    '    @property',
+                    '    def %s(self):' % key_attribute(column, key, taken)]
+            if info['doc']:
+                out.append("        '''%s'''" % first_sentence(info['doc']))
+            line = '        return %s(self.%s.get(%s))' % (parser, attribute,
+                                                        lookup)
+            if len(line) > 79:
+                line = '        return %s(\n            self.%s.get(%s))' \
+                    % (parser, attribute, lookup)
+            out.append(line)
+    return out
+
+
+def generate(schema, keys, schema_name, xml_name):
+    out = [HEADER % {'schema': schema_name, 'xml': xml_name}]
+    lines = []
+    for table_name, table in schema['tables'].items():
+        lines += generate_class(table_name, table, keys.get(table_name, {}))
+    lines += ['', '',
+              '# Row class of every table, by table name.',
+              'TABLES = {']
+    lines += ["    '%s': %s," % (t, t) for t in schema['tables']]
+    lines.append('}')
+    return out[0] + '\n'.join(lines) + '\n'
+
+
+#
+# main
+#
+def main(argv):
+    if len(argv) != 3:
+        print("Usage: rowclasses.py input-schema input-xml output")
+        return 1
+    orig_schema, xml, output = argv
+
+    text = generate(extschema.load(orig_schema), extschema.load_keys(xml),
+                    orig_schema.split('/')[-1], xml.split('/')[-1])
+    with open(output, 'w') as fp:
+        fp.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -2,51 +2,251 @@
 '''
 Strips all keys in DROP_KEYS from input-schema and writes the resulting
 OpenvSwitch-ready schema to output-schema.
+
+Usage:
+    sanitize.py input-schema output-schema
+    sanitize.py --batch input-schema [input-schema ...]
+
+The result is checked for members that OVSDB does not define in tables,
+columns and column types, such as a misplaced column, which ovsdb-server
+would reject.
+
+In batch mode every input-schema (*.extschema) is sanitized into the
+matching *.ovsschema next to it, all in one interpreter run.
+
+The checksum is the POSIX cksum(1) CRC computed in-process. The content
+digest of every input is recorded in a cache file so that schemas that
+have not changed since the last run (and whose output is still intact)
+are skipped.
 '''
 
+import os
 import sys
-from subprocess import Popen, PIPE
-from collections import OrderedDict
 import json
+import hashlib
+import argparse
+from collections import OrderedDict
+
+import extschema
+
+DROP_KEYS = ('category', 'relationship', 'replication', 'publish',
+             'idl_indexes')
+
+CACHE_NAME = '.sanitize.cache'
+
+# CRC-32 as used by POSIX cksum(1): polynomial 0x04C11DB7, MSB first,
+# no reflection, followed by the length of the input and a final
+# complement.
+CKSUM_POLY = 0x04C11DB7
+
+
+def _make_cksum_table():
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            if crc & 0x80000000:
+                crc = ((crc << 1) ^ CKSUM_POLY) & 0xFFFFFFFF
+            else:
+                crc = (crc << 1) & 0xFFFFFFFF
+        table.append(crc)
+    return table
 
-DROP_KEYS = ('category', 'relationship')
+CKSUM_TABLE = _make_cksum_table()
 
-def delete_keys(objname):
-    for key in DROP_KEYS:
+
+def cksum(data):
+    '''
+    Returns the "CRC LENGTH" string that cksum(1) prints for data
+    (a byte string).
+    '''
+    crc = 0
+    table = CKSUM_TABLE
+    data = bytearray(data)
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[(crc >> 24) ^ byte]
+    length = len(data)
+    n = length
+    while n:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[(crc >> 24) ^ (n & 0xFF)]
+        n >>= 8
+    return '%d %d' % (~crc & 0xFFFFFFFF, length)
+
+
+def delete_keys(objname, drop_keys=DROP_KEYS):
+    for key in drop_keys:
         objname.pop(key, None)
-    for key, value in objname.iteritems():
+    for key, value in objname.items():
         if type(value) == OrderedDict:
-            delete_keys(value)
+            delete_keys(value, drop_keys)
+
+
+def sanitize_schema(schema):
+    '''
+    Removes the extended annotations from schema (in place) and returns
+    the OpenvSwitch-ready schema text, with the 'cksum' field added.
+    Raises ValueError if the result is not a valid OVSDB schema.
+    '''
+    delete_keys(schema)
+    errors = extschema.check_structure(schema)
+    if errors:
+        raise ValueError('\n'.join(errors))
+    # Remove any top-level "cksum" present in the input
+    schema.pop("cksum", None)
+
+    # Calculate new checksum.
+    schema_text = json.dumps(schema, indent=2, separators=(',', ': ')) + '\n'
+
+    # Keep the 'cksum' key at the top of the OrderedDict so that the JSON
+    # output will have it at the start, and the broken validation code in
+    # openvswitch still works.
+    schema_cksum = OrderedDict([('cksum', cksum(schema_text.encode('utf-8')))])
+    schema_cksum.update(schema)
+
+    return json.dumps(schema_cksum, indent=2, separators=(',', ': ')) + '\n'
+
+
+def _digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _tool_digest():
+    # Changes to this script (e.g. to DROP_KEYS) invalidate the cache.
+    with open(os.path.abspath(__file__).replace('.pyc', '.py'), 'rb') as fp:
+        return _digest(fp.read())
+
+
+class SanitizeCache(object):
+    '''
+    Maps an input schema path to the digests of its last sanitized input
+    and output. An entry is only trusted while the output file still has
+    the recorded digest.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.tool = _tool_digest()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as fp:
+                    cache = json.load(fp)
+                if cache.get('tool') == self.tool:
+                    self.entries = cache.get('entries', {})
+            except ValueError:
+                self.entries = {}
+
+    def is_fresh(self, orig_schema, ovs_schema, in_digest):
+        entry = self.entries.get(os.path.abspath(orig_schema))
+        if not entry or entry.get('input') != in_digest or \
+                entry.get('output_path') != os.path.abspath(ovs_schema):
+            return False
+        if not os.path.exists(ovs_schema):
+            return False
+        with open(ovs_schema, 'rb') as fp:
+            return _digest(fp.read()) == entry.get('output')
+
+    def update(self, orig_schema, ovs_schema, in_digest, out_digest):
+        self.entries[os.path.abspath(orig_schema)] = {
+            'input': in_digest,
+            'output': out_digest,
+            'output_path': os.path.abspath(ovs_schema),
+        }
+        self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump({'tool': self.tool, 'entries': self.entries}, fp,
+                      indent=2, sort_keys=True)
+            fp.write('\n')
+        os.rename(tmp, self.path)
+        self.dirty = False
+
+
+def sanitize(orig_schema, ovs_schema, cache=None):
+    '''
+    Sanitizes orig_schema into ovs_schema. Returns False when the cache
+    says the output is already up to date, True otherwise.
+    '''
+    with open(orig_schema, 'rb') as fp:
+        data = fp.read()
+    in_digest = _digest(data)
+
+    if cache is not None and cache.is_fresh(orig_schema, ovs_schema,
+                                            in_digest):
+        return False
+
+    schema = json.loads(data.decode('utf-8'), object_pairs_hook=OrderedDict)
+    output = sanitize_schema(schema)
+
+    with open(ovs_schema, 'w') as fp:
+        fp.write(output)
+
+    if cache is not None:
+        cache.update(orig_schema, ovs_schema, in_digest,
+                     _digest(output.encode('utf-8')))
+    return True
+
+
+def output_name(orig_schema):
+    return os.path.splitext(orig_schema)[0] + '.ovsschema'
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Strip extended annotations from OVSDB schemas.')
+    parser.add_argument('--batch', action='store_true',
+                        help='sanitize every input-schema into the matching '
+                             '.ovsschema next to it')
+    parser.add_argument('--cache', metavar='FILE',
+                        help='cache file (default: %s next to the output)'
+                             % CACHE_NAME)
+    parser.add_argument('--no-cache', action='store_true',
+                        help='always regenerate the output')
+    parser.add_argument('schemas', nargs='+', metavar='schema')
+    args = parser.parse_args(argv)
+
+    if not args.batch and len(args.schemas) != 2:
+        parser.error('expected input-schema output-schema')
+    return args
+
 
 #
 # main
 #
-if len(sys.argv) < 3:
-    print("Usage: sanitize.py input-schema output-schema")
-    sys.exit(1)
-
-orig_schema, ovs_schema = sys.argv[1:3]
-
-f = open(orig_schema).read()
-schema = json.loads(f, object_pairs_hook=OrderedDict)
-
-delete_keys(schema)
-# Remove any top-level "cksum" present in the input
-schema.pop("cksum", None)
-
-# Calculate new checksum.
-schema_text = json.dumps(schema, indent=2, separators=(',', ': ')) + '\n'
-cksum_pipe = Popen('cksum', stdin=PIPE, stdout=PIPE)
-output, err = cksum_pipe.communicate(input=schema_text)
-
-# Keep the 'cksum' key at the top of the OrderedDict so that the JSON
-# output will have it at the start, and the broken validation code in
-# openvswitch still works.
-cksum = ' '.join(output.split()[:2])
-schema_cksum = OrderedDict([('cksum', cksum)])
-schema_cksum.update(schema)
-
-# Rewrite with cksum field added.
-with open(ovs_schema, 'w') as fp:
-    json.dump(schema_cksum, fp, indent=2, separators=(',', ': '))
-    fp.write('\n')
+def main(argv):
+    args = parse_args(argv)
+
+    if args.batch:
+        jobs = [(s, output_name(s)) for s in args.schemas]
+    else:
+        jobs = [tuple(args.schemas)]
+
+    caches = {}
+    for orig_schema, ovs_schema in jobs:
+        cache = None
+        if not args.no_cache:
+            path = args.cache or os.path.join(
+                os.path.dirname(os.path.abspath(ovs_schema)), CACHE_NAME)
+            if path not in caches:
+                caches[path] = SanitizeCache(path)
+            cache = caches[path]
+        try:
+            fresh = not sanitize(orig_schema, ovs_schema, cache)
+        except ValueError as e:
+            print('sanitize.py: %s:\n%s' % (orig_schema, e))
+            return 1
+        if fresh and args.batch:
+            print("%s is up to date" % ovs_schema)
+
+    for cache in caches.values():
+        cache.save()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
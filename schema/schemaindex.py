@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+'''
+Compiles an extended schema into a compact binary index that daemons can
+load by memory-mapping it, instead of parsing the extschema JSON (and the
+XML documentation) at startup.
+
+Usage:
+    schemaindex.py input-schema output-index
+    schemaindex.py --dump index [table]
+
+The index holds, for every table, its columns with category,
+relationship, kind (scalar/optional/set/map), key and value types,
+refTable, min/max and a few flags. Tables and the columns of each table
+are sorted by name so that lookups are binary searches over the mapped
+file.
+
+File layout (all integers little endian):
+
+    header      HEADER
+    tables      TABLE * ntables
+    columns     COLUMN * ncolumns
+    offsets     uint32 * (nstrings + 1)
+    strings     UTF-8 data, string i is data[offsets[i]:offsets[i + 1]]
+'''
+
+import os
+import sys
+import mmap
+import struct
+from collections import namedtuple
+
+import extschema
+
+MAGIC = b'OPSSIDX\0'
+FORMAT_VERSION = 1
+
+# magic, format version, ntables, ncolumns, nstrings, tables offset,
+# columns offset, string offsets offset, string data offset, schema
+# name, schema version.
+HEADER = struct.Struct('<8sHHIIIIIIII')
+# name, first column, ncolumns, flags, maxRows, indexes.
+TABLE = struct.Struct('<IIHHII')
+# name, category, relationship, kind, key type, value type, flags, min,
+# max, key refTable, value refTable, category argument.
+COLUMN = struct.Struct('<IBBBBBBIIIII')
+OFFSET = struct.Struct('<I')
+
+NONE = 0xFFFFFFFF
+
+CATEGORIES = (None, 'configuration', 'status', 'statistics', 'follows',
+              'per-value')
+RELATIONSHIPS = (None, '1:m', 'm:1', 'reference')
+KINDS = ('scalar', 'optional', 'set', 'map')
+ATOMIC_TYPES = (None, 'integer', 'real', 'boolean', 'string', 'uuid')
+
+# Table flags.
+TABLE_IS_ROOT = 0x01
+
+# Column flags.
+COLUMN_IMMUTABLE = 0x01
+COLUMN_EPHEMERAL = 0x02
+COLUMN_KEY_WEAK = 0x04
+COLUMN_VALUE_WEAK = 0x08
+
+TableInfo = namedtuple('TableInfo', 'name is_root max_rows indexes')
+ColumnInfo = namedtuple('ColumnInfo', [
+    'name', 'category', 'category_arg', 'relationship', 'kind',
+    'key_type', 'value_type', 'min', 'max', 'key_ref_table',
+    'value_ref_table', 'mutable', 'ephemeral', 'key_ref_type',
+    'value_ref_type'])
+
+
+class _StringTable(object):
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def add(self, s):
+        if s is None:
+            return NONE
+        if s not in self.ids:
+            self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return self.ids[s]
+
+
+def _encode_indexes(indexes):
+    return ';'.join(','.join(index) for index in indexes) if indexes else None
+
+
+def _encode_category_arg(category, arg):
+    if category == 'per-value':
+        return ','.join('%s=%s' % (v['value'], v['category']) for v in arg)
+    return arg
+
+
+def compile_index(schema):
+    '''
+    Returns the binary index for schema (as loaded by extschema.load).
+    '''
+    strings = _StringTable()
+    tables = []
+    columns = []
+
+    for table_name in sorted(schema['tables']):
+        table = schema['tables'][table_name]
+        flags = TABLE_IS_ROOT if table.get('isRoot') else 0
+        tables.append(TABLE.pack(strings.add(table_name), len(columns),
+                                 len(table['columns']), flags,
+                                 table.get('maxRows', NONE),
+                                 strings.add(_encode_indexes(
+                                     table.get('indexes')))))
+
+        for column_name in sorted(table['columns']):
+            coldef = table['columns'][column_name]
+            coltype = extschema.column_type(coldef)
+            category, arg = extschema.column_category(coldef)
+
+            flags = 0
+            if not coldef.get('mutable', True):
+                flags |= COLUMN_IMMUTABLE
+            if coldef.get('ephemeral', False):
+                flags |= COLUMN_EPHEMERAL
+            if coltype.key.get('refType') == 'weak':
+                flags |= COLUMN_KEY_WEAK
+            value = coltype.value or {}
+            if value.get('refType') == 'weak':
+                flags |= COLUMN_VALUE_WEAK
+
+            max_ = coltype.max
+            columns.append(COLUMN.pack(
+                strings.add(column_name),
+                CATEGORIES.index(category),
+                RELATIONSHIPS.index(coldef.get('relationship')),
+                KINDS.index(coltype.kind()),
+                ATOMIC_TYPES.index(coltype.key['type']),
+                ATOMIC_TYPES.index(value.get('type')),
+                flags,
+                coltype.min,
+                NONE if max_ == extschema.UNLIMITED else max_,
+                strings.add(coltype.key.get('refTable')),
+                strings.add(value.get('refTable')),
+                strings.add(_encode_category_arg(category, arg))))
+
+    name = strings.add(schema['name'])
+    version = strings.add(schema.get('version'))
+
+    data = [s.encode('utf-8') for s in strings.strings]
+    offsets = [0]
+    for s in data:
+        offsets.append(offsets[-1] + len(s))
+
+    tables_off = HEADER.size
+    columns_off = tables_off + TABLE.size * len(tables)
+    offsets_off = columns_off + COLUMN.size * len(columns)
+    data_off = offsets_off + OFFSET.size * len(offsets)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(tables), len(columns),
+                         len(data), tables_off, columns_off, offsets_off,
+                         data_off, name, version)
+    return b''.join([header] + tables + columns +
+                    [OFFSET.pack(o) for o in offsets] + data)
+
+
+class SchemaIndex(object):
+    '''
+    Read-only view over a memory-mapped schema index.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as fp:
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self._ntables, self._ncolumns, self._nstrings,
+         self._tables_off, self._columns_off, self._offsets_off,
+         self._data_off, name, schema_version) = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._map.close()
+            raise ValueError('%s: not a version %d schema index'
+                             % (path, FORMAT_VERSION))
+        self.name = self._string(name)
+        self.version = self._string(schema_version)
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _string(self, i):
+        if i == NONE:
+            return None
+        start, end = struct.unpack_from('<II', self._map,
+                                        self._offsets_off + OFFSET.size * i)
+        return self._map[self._data_off + start:
+                         self._data_off + end].decode('utf-8')
+
+    def _table_record(self, i):
+        return TABLE.unpack_from(self._map, self._tables_off + TABLE.size * i)
+
+    def _column_record(self, i):
+        return COLUMN.unpack_from(self._map,
+                                  self._columns_off + COLUMN.size * i)
+
+    @staticmethod
+    def _search(lo, hi, name, record, string):
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_name = string(record(mid)[0])
+            if mid_name < name:
+                lo = mid + 1
+            elif mid_name > name:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def _find_table(self, name):
+        i = self._search(0, self._ntables, name, self._table_record,
+                         self._string)
+        if i is None:
+            raise KeyError(name)
+        return self._table_record(i)
+
+    def _table_info(self, record):
+        name, _, _, flags, max_rows, indexes = record
+        indexes = self._string(indexes)
+        return TableInfo(
+            self._string(name), bool(flags & TABLE_IS_ROOT),
+            None if max_rows == NONE else max_rows,
+            [index.split(',') for index in indexes.split(';')]
+            if indexes else [])
+
+    def _column_info(self, record):
+        (name, category, relationship, kind, key_type, value_type, flags,
+         min_, max_, key_ref, value_ref, arg) = record
+        category = CATEGORIES[category]
+        arg = self._string(arg)
+        if category == 'per-value':
+            arg = [dict(zip(('value', 'category'), v.split('=', 1)))
+                   for v in arg.split(',')]
+        return ColumnInfo(
+            self._string(name), category, arg, RELATIONSHIPS[relationship],
+            KINDS[kind], ATOMIC_TYPES[key_type], ATOMIC_TYPES[value_type],
+            min_, extschema.UNLIMITED if max_ == NONE else max_,
+            self._string(key_ref), self._string(value_ref),
+            not flags & COLUMN_IMMUTABLE, bool(flags & COLUMN_EPHEMERAL),
+            'weak' if flags & COLUMN_KEY_WEAK else
+            ('strong' if key_ref != NONE else None),
+            'weak' if flags & COLUMN_VALUE_WEAK else
+            ('strong' if value_ref != NONE else None))
+
+    def tables(self):
+        return [self._string(self._table_record(i)[0])
+                for i in range(self._ntables)]
+
+    def table(self, name):
+        return self._table_info(self._find_table(name))
+
+    def columns(self, table):
+        _, first, count, _, _, _ = self._find_table(table)
+        return [self._column_info(self._column_record(i))
+                for i in range(first, first + count)]
+
+    def column(self, table, name):
+        _, first, count, _, _, _ = self._find_table(table)
+        i = self._search(first, first + count, name, self._column_record,
+                         self._string)
+        if i is None:
+            raise KeyError('%s.%s' % (table, name))
+        return self._column_info(self._column_record(i))
+
+
+def dump(path, table=None):
+    with SchemaIndex(path) as index:
+        print('%s %s' % (index.name, index.version))
+        for name in [table] if table else index.tables():
+            info = index.table(name)
+            print('%s%s' % (name, ' (root)' if info.is_root else ''))
+            for col in index.columns(name):
+                print('  %-32s %-13s %-9s %-8s %s%s' % (
+                    col.name, col.category or '-', col.relationship or '-',
+                    col.kind, col.key_type,
+                    ':' + col.value_type if col.value_type else ''))
+
+
+#
+# main
+#
+def main(argv):
+    if len(argv) >= 2 and argv[0] == '--dump':
+        dump(*argv[1:3])
+        return 0
+    if len(argv) != 2:
+        print("Usage: schemaindex.py input-schema output-index\n"
+              "       schemaindex.py --dump index [table]")
+        return 1
+
+    orig_schema, index_path = argv
+    data = compile_index(extschema.load(orig_schema))
+    tmp = index_path + '.tmp'
+    with open(tmp, 'wb') as fp:
+        fp.write(data)
+    os.rename(tmp, index_path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
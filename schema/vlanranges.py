@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+'''
+Converts between VLAN ID lists, VLAN range strings and VLAN bitmaps, and
+builds the single OVSDB transaction that creates or deletes a range of
+VLANs.
+
+Usage:
+    vlanranges.py format RANGES
+    vlanranges.py create [--vlans FILE] BRIDGE RANGES
+    vlanranges.py delete --vlans FILE BRIDGE RANGES
+
+A range string is a comma-separated list of VLAN IDs and inclusive
+"low-high" ranges, e.g. "1,10-20,4000-4094", as accepted by the CLI and
+stored in Port:trunk_ranges. Its canonical form lists sorted, merged
+ranges, and single IDs without a dash. A bitmap is an integer whose bit
+N is set when VLAN N is included, the representation switchd programs
+from.
+
+"format" prints the canonical form of RANGES. "create" and "delete"
+print the parameters of an ovsdb-client transact call that creates (or
+deletes) every VLAN of RANGES on the bridge with UUID BRIDGE, in one
+transaction. FILE is a JSON object mapping the VLAN IDs that exist on
+the bridge to their UUIDs: create skips them, delete needs them.
+'''
+
+import sys
+import json
+import argparse
+
+DATABASE = 'OpenSwitch'
+VLAN_MIN = 1
+VLAN_MAX = 4094
+
+
+def parse_ranges(text):
+    '''
+    Returns the sorted list of VLAN IDs of a range string. Raises
+    ValueError for malformed strings and out-of-range IDs.
+    '''
+    vlans = set()
+    for part in text.replace(' ', '').split(','):
+        if not part:
+            continue
+        low, dash, high = part.partition('-')
+        try:
+            low = int(low)
+            high = int(high) if dash else low
+        except ValueError:
+            raise ValueError('"%s" is not a VLAN or VLAN range' % part)
+        if not VLAN_MIN <= low <= high <= VLAN_MAX:
+            raise ValueError('"%s" is not within %d-%d, in increasing order'
+                             % (part, VLAN_MIN, VLAN_MAX))
+        vlans.update(range(low, high + 1))
+    return sorted(vlans)
+
+
+def ranges(vlans):
+    '''
+    Returns the list of (low, high) ranges of an iterable of VLAN IDs.
+    '''
+    result = []
+    for vlan in sorted(set(vlans)):
+        if result and result[-1][1] == vlan - 1:
+            result[-1] = (result[-1][0], vlan)
+        else:
+            result.append((vlan, vlan))
+    return result
+
+
+def format_ranges(vlans):
+    '''
+    Returns the canonical range string of an iterable of VLAN IDs.
+    '''
+    return ','.join('%d' % low if low == high else '%d-%d' % (low, high)
+                    for low, high in ranges(vlans))
+
+
+def to_bitmap(vlans):
+    bitmap = 0
+    for low, high in ranges(vlans):
+        bitmap |= ((1 << (high - low + 1)) - 1) << low
+    return bitmap
+
+
+def from_bitmap(bitmap):
+    vlans = []
+    while bitmap:
+        low = bitmap & -bitmap
+        vlans.append(low.bit_length() - 1)
+        bitmap ^= low
+    return vlans
+
+
+def create_ops(bridge, vlans, existing=()):
+    '''
+    Returns the operations of the transaction that creates the VLANs of
+    vlans that are not in existing on bridge: one insert per VLAN and a
+    single mutate of Bridge:vlans.
+    '''
+    ops, names = [], []
+    for vlan in vlans:
+        if vlan in existing:
+            continue
+        name = 'vlan%d' % vlan
+        ops.append({'op': 'insert', 'table': 'VLAN', 'uuid-name': name,
+                    'row': {'id': vlan, 'name': 'VLAN%d' % vlan}})
+        names.append(['named-uuid', name])
+    if names:
+        ops.append(_mutate_vlans(bridge, 'insert', names))
+    return ops
+
+
+def delete_ops(bridge, vlans, existing):
+    '''
+    Returns the operations of the transaction that deletes the VLANs of
+    vlans found in existing, {id: uuid}, from bridge. VLAN is not a root
+    table: removing the rows from Bridge:vlans deletes them.
+    '''
+    uuids = [['uuid', existing[vlan]] for vlan in vlans if vlan in existing]
+    return [_mutate_vlans(bridge, 'delete', uuids)] if uuids else []
+
+
+def _mutate_vlans(bridge, mutator, uuids):
+    return {'op': 'mutate', 'table': 'Bridge',
+            'where': [['_uuid', '==', ['uuid', bridge]]],
+            'mutations': [['vlans', mutator, ['set', uuids]]]}
+
+
+def load_vlans(path):
+    with open(path) as fp:
+        return dict((int(vlan), uuid) for vlan, uuid in json.load(fp).items())
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Convert VLAN ranges and build bulk VLAN transactions.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    subparsers.add_parser('format').add_argument('ranges')
+    for command in ('create', 'delete'):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument('--vlans', metavar='FILE',
+                               required=command == 'delete',
+                               help='JSON object of VLAN ID to UUID')
+        subparser.add_argument('bridge')
+        subparser.add_argument('ranges')
+    return parser.parse_args(argv)
+
+
+#
+# main
+#
+def main(argv):
+    args = parse_args(argv)
+    try:
+        vlans = parse_ranges(args.ranges)
+    except ValueError as e:
+        print('vlanranges.py: %s' % e)
+        return 1
+
+    if args.command == 'format':
+        print(format_ranges(vlans))
+        return 0
+
+    existing = load_vlans(args.vlans) if args.vlans else {}
+    if args.command == 'create':
+        ops = create_ops(args.bridge, vlans, existing)
+    else:
+        ops = delete_ops(args.bridge, vlans, existing)
+    print(json.dumps([DATABASE] + ops))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))